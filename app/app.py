@@ -1,138 +1,232 @@
-from fastapi import FastAPI, HTTPException, Depends
-from sqlalchemy import func
-from sqlmodel import SQLModel, create_engine, Session, select
+from fastapi import FastAPI, HTTPException, Depends, Query
+from sqlalchemy import insert, tuple_
+from sqlmodel import SQLModel, Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from database import engine, async_engine, get_session, run_db, upsert_insert, DB_MODE
+from reference_cache import ReferenceDataCache
+from ids import generate_id
+from error_sink import ValidationErrorSink
+from request_metrics import RequestMetrics, RequestMetricsMiddleware
+from pagination import encode_cursor, decode_cursor
+from load_static_data import load_static_transactions
+from transaction_stats import (
+    record_transactions, read_summary, read_daily, count_exact,
+    rebuild_transaction_stats, rebuild_transaction_stats_if_empty
+)
 from models import (
     Transaction, TransactionIn, TransactionItemIn, 
-    TransactionError, Transaction_STATIC, Customer, 
-    Item, PaymentMethod, TransactionItem
+    TransactionError, Customer, 
+    Item, PaymentMethod, TransactionItem, TransactionBatchResult,
+    TransactionPage, TransactionSummary, TransactionDailyStats
 )
 from contextlib import asynccontextmanager
-import csv
 import os
+import threading
 from dotenv import load_dotenv
-from datetime import datetime
+from datetime import date, datetime
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.requests import Request
-from typing import List
-import uuid
-import hashlib
+from typing import List, Literal
+from pydantic import ValidationError
 
 load_dotenv()
 
 # --- environment variables ---
-DATABASE_URL = os.getenv("DATABASE_URL")
 CSV_FILE_PATH = os.getenv("CSV_FILE_PATH")
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "1000"))
+REFERENCE_CACHE_TTL = float(os.getenv("REFERENCE_CACHE_TTL", "30"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "1000"))
+DEFAULT_PAGE_SIZE = 100  # page size when only a cursor is passed
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", "1000"))
+STATIC_BOOTSTRAP = os.getenv("STATIC_BOOTSTRAP", "background")  # inline, background, skip
+ERROR_SINK_MAX_QUEUED = int(os.getenv("ERROR_SINK_MAX_QUEUED", "10000"))
+ERROR_SINK_BATCH_SIZE = int(os.getenv("ERROR_SINK_BATCH_SIZE", "500"))
+ERROR_SINK_FLUSH_SECONDS = float(os.getenv("ERROR_SINK_FLUSH_SECONDS", "1"))
+PROFILE_DIR = os.getenv("PROFILE_DIR")  # unset disables the request profiler
+PROFILE_SLOW_SECONDS = float(os.getenv("PROFILE_SLOW_SECONDS", "1"))
 
-# --- create engine ---
-engine = create_engine(DATABASE_URL)
+# --- reference data cache (items, payment methods) ---
+reference_cache = ReferenceDataCache(ttl_seconds=REFERENCE_CACHE_TTL)
 
-# --- create session ---
-def get_session():
-    with Session(engine) as session:
-        yield session
+# --- validation errors, written to transactions_errors in batches ---
+# body keys copied into the record, the raw transaction fields of a payload
+ERROR_PAYLOAD_FIELDS = (
+    "transaction_id", "item", "quantity", "price_per_unit",
+    "total_spent", "payment_method", "location", "transaction_date"
+)
+error_sink = ValidationErrorSink(
+    max_queued=ERROR_SINK_MAX_QUEUED,
+    batch_size=ERROR_SINK_BATCH_SIZE,
+    flush_seconds=ERROR_SINK_FLUSH_SECONDS
+)
+
+# --- request metrics (latency, SQL statements, pool waits per route) ---
+request_metrics = RequestMetrics(profile_dir=PROFILE_DIR, profile_slow_seconds=PROFILE_SLOW_SECONDS)
+request_metrics.instrument(engine)
+if async_engine is not None:
+    request_metrics.instrument(async_engine.sync_engine)
+
+def bootstrap_static_transactions():
+    try:
+        load_static_transactions(engine, CSV_FILE_PATH)
+    except Exception as e:
+        print(f"❌ failed to import transactions from CSV: {str(e)}")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    print("🚀 App is starting...")
+    print(f"🚀 App is starting... (DB_MODE={DB_MODE})")
 
     SQLModel.metadata.create_all(engine)
 
     with Session(engine) as session:
-        result = session.exec(select(Transaction_STATIC)).first()
-        if result:
-            print("🔁 Transactions already exist. Skipping CSV import.")
-        else:
-            print("📥 Importing transactions from CSV...")
-            with open(CSV_FILE_PATH, 'r') as f:
-                reader = csv.DictReader(f)
-                transactions = []
-                transactions_errors = []
-                for row in reader:
-                    try:
-                        tx = Transaction_STATIC(
-                            transaction_id=row["Transaction ID"],
-                            item=row["Item"],
-                            quantity=row["Quantity"],
-                            price_per_unit=row["Price Per Unit"],
-                            total_spent=row["Total Spent"],
-                            payment_method=row["Payment Method"],
-                            location=row["Location"],
-                            transaction_date=row["Transaction Date"]
-                        )
-                        transactions.append(tx)
-                    except Exception as e:
-                        print(f"⚠️ Error parsing row: {row}")
-                        tx_e = TransactionError(
-                            transaction_id=row["Transaction ID"],
-                            item=row["Item"],
-                            quantity=row["Quantity"],
-                            price_per_unit=row["Price Per Unit"],
-                            total_spent=row["Total Spent"],
-                            payment_method=row["Payment Method"],
-                            location=row["Location"],
-                            transaction_date=row["Transaction Date"],
-                            error_message=str(e),
-                            created_at=datetime.now()
-                        )
-                        transactions_errors.append(tx_e)
-                        continue
-
-                session.add_all(transactions)
-                session.add_all(transactions_errors)
-                session.commit()
-                print(f"✅ Inserted {len(transactions)} transactions.")
+        rebuild_transaction_stats_if_empty(session)
+
+    # historical csv: inline blocks startup until loaded, background loads it
+    # on a thread while requests are served, skip leaves it to load_static_data.py
+    if STATIC_BOOTSTRAP == "inline":
+        load_static_transactions(engine, CSV_FILE_PATH)
+    elif STATIC_BOOTSTRAP == "background":
+        threading.Thread(
+            target=bootstrap_static_transactions, name="static-bootstrap", daemon=True
+        ).start()
+    error_sink.start()
     yield
 
+    # write the validation errors still queued before the engines go away
+    await error_sink.stop()
+
+    if async_engine is not None:
+        await async_engine.dispose()
+
 app = FastAPI(lifespan=lifespan)
+app.add_middleware(RequestMetricsMiddleware, metrics=request_metrics)
 
 # --- API Routes ---
-# get all transactions
-@app.get("/transactions", response_model=List[Transaction])
-def get_all_transactions(session: Session = Depends(get_session)):
-    statement = select(Transaction)
-    transactions = session.exec(statement).all()
-    return transactions
-
-# get total transactions count
+# get all transactions as a plain list, like before pagination existed.
+# passing limit or cursor opts in to a keyset page on (created_at, transaction_id),
+# format=ndjson streams every matching row instead
+@app.get("/transactions", response_model=List[Transaction] | TransactionPage)
+async def get_all_transactions(
+    limit: int | None = Query(default=None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    created_from: datetime | None = None,
+    created_to: datetime | None = None,
+    format: Literal["json", "ndjson"] = "json"
+):
+    statement = select(Transaction).order_by(Transaction.created_at, Transaction.transaction_id)
+    if created_from is not None:
+        statement = statement.where(Transaction.created_at >= created_from)
+    if created_to is not None:
+        statement = statement.where(Transaction.created_at < created_to)
+    if cursor is not None:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        statement = statement.where(
+            tuple_(Transaction.created_at, Transaction.transaction_id) > tuple_(*after)
+        )
+
+    if format == "ndjson":
+        stream = stream_transactions_async if DB_MODE == "async" else stream_transactions
+        return StreamingResponse(stream(statement), media_type="application/x-ndjson")
+
+    if limit is None and cursor is None:
+        return await run_db(select_transactions, statement)
+    return await run_db(select_transactions_page, statement, limit or DEFAULT_PAGE_SIZE)
+
+def select_transactions(session: Session, statement) -> List[Transaction]:
+    return session.exec(statement).all()
+
+def select_transactions_page(session: Session, statement, limit: int) -> TransactionPage:
+    # fetch one extra row to know whether there is a next page
+    transactions = session.exec(statement.limit(limit + 1)).all()
+    next_cursor = None
+    if len(transactions) > limit:
+        transactions = transactions[:limit]
+        last = transactions[-1]
+        next_cursor = encode_cursor(last.created_at, last.transaction_id)
+    return TransactionPage(items=transactions, next_cursor=next_cursor)
+
+def stream_transactions(statement):
+    # own session: the stream outlives the request.
+    # yield_per reads through a server-side cursor, so memory stays flat
+    with Session(engine) as session:
+        result = session.exec(statement.execution_options(yield_per=STREAM_CHUNK_SIZE))
+        for chunk in result.partitions():
+            yield "".join(tx.model_dump_json() + "\n" for tx in chunk)
+
+async def stream_transactions_async(statement):
+    async with AsyncSession(async_engine) as session:
+        result = await session.stream_scalars(statement.execution_options(yield_per=STREAM_CHUNK_SIZE))
+        async for chunk in result.partitions():
+            yield "".join(tx.model_dump_json() + "\n" for tx in chunk)
+
+# get total transactions count, read from the daily stats unless exact=true
 @app.get("/transactions/count", response_model=int)
-def get_total_transactions(session: Session = Depends(get_session)):
-    statement = select(func.count()).select_from(Transaction)
-    total = session.exec(statement).one()
-    return total
+async def get_total_transactions(exact: bool = False):
+    if exact:
+        return await run_db(count_exact)
+    summary = await run_db(read_summary)
+    return summary.transaction_count
+
+# get total transactions and revenue
+@app.get("/transactions/summary", response_model=TransactionSummary)
+async def get_transactions_summary():
+    return await run_db(read_summary)
+
+# get transactions count and revenue per day
+@app.get("/transactions/summary/daily", response_model=List[TransactionDailyStats])
+async def get_transactions_daily_summary(start: date | None = None, end: date | None = None):
+    return await run_db(read_daily, start, end)
+
+# recompute the summary from the transactions table
+@app.post("/transactions/summary/rebuild", response_model=TransactionSummary)
+async def rebuild_transactions_summary():
+    return await run_db(rebuild_transaction_stats)
 
 # get single transaction
 @app.get("/transactions/{transaction_id}", response_model=Transaction)
-def get_transaction_by_id(transaction_id: str, session: Session = Depends(get_session)):
-    transaction = session.get(Transaction, transaction_id)
+async def get_transaction_by_id(transaction_id: str):
+    transaction = await run_db(Session.get, Transaction, transaction_id)
     if transaction is None:
         raise HTTPException(status_code=404, detail="Transaction not found")
     return transaction
 
 # create transaction
 @app.post("/transactions", response_model=Transaction, status_code=201)
-def create_transaction(tx_in: TransactionIn, session: Session = Depends(get_session)):
+async def create_transaction(tx_in: TransactionIn):
+    return await run_db(insert_transaction, tx_in)
+
+def insert_transaction(session: Session, tx_in: TransactionIn) -> Transaction:
     try:
         # 1. find or create customer
         customer = session.exec(
             select(Customer).where(Customer.email == tx_in.customer_email)
         ).first()
         
-        if not customer:
-            customer = Customer(
+        if customer:
+            customer_id = customer.customer_id
+        else:
+            # upsert, a concurrent request may be creating the same customer
+            now = datetime.now()
+            customer_stmt = upsert_insert(session, Customer).values(
                 email=tx_in.customer_email,
-                name=tx_in.customer_email.split('@')[0]  # 簡單的預設名稱
+                name=tx_in.customer_email.split('@')[0],  # 簡單的預設名稱
+                created_at=now,
+                updated_at=now
             )
-            session.add(customer)
-            # refresh to get customer_id
-            session.flush()
+            customer_stmt = customer_stmt.on_conflict_do_update(
+                index_elements=[Customer.email],
+                set_={"email": customer_stmt.excluded.email}
+            ).returning(Customer.customer_id)
+            customer_id = session.exec(customer_stmt).scalar_one()
         
         # 2. find payment method
-        payment_method = session.exec(
-            select(PaymentMethod).where(PaymentMethod.name == tx_in.payment_method)
-        ).first()
+        payment_method_id = reference_cache.get_payment_method_id(session, tx_in.payment_method)
         
-        if not payment_method:
+        if payment_method_id is None:
             raise HTTPException(
                 status_code=404,
                 detail=f"Payment method not found: {tx_in.payment_method}"
@@ -142,15 +236,14 @@ def create_transaction(tx_in: TransactionIn, session: Session = Depends(get_sess
         total_spent = 0
         transaction_items = []
         
-        # 4. generate transaction id
-        raw_id = uuid.uuid4().hex
-        transaction_id = hashlib.sha256(raw_id.encode()).hexdigest()[:16]
+        # 4. generate transaction id, time-ordered so inserts append to the indexes
+        transaction_id = generate_id()
         
         # 5. create transaction record
         new_transaction = Transaction(
             transaction_id=transaction_id,
-            customer_id=customer.customer_id,
-            payment_method_id=payment_method.payment_method_id,
+            customer_id=customer_id,
+            payment_method_id=payment_method_id,
             location=tx_in.location,
             total_spent=0,  # temporarily set to 0, will be updated later
             status="completed",
@@ -162,13 +255,10 @@ def create_transaction(tx_in: TransactionIn, session: Session = Depends(get_sess
         session.flush()
         
         # 6. create transaction items
+        # find items, the cache keeps the latest price of each item
+        items = reference_cache.get_items(session, [item_in.item_name for item_in in tx_in.items])
         for item_in in tx_in.items:
-            # find item, ensure using the latest price
-            item = session.exec(
-                select(Item)
-                .where(Item.name == item_in.item_name)
-                .order_by(Item.updated_at.desc())
-            ).first()
+            item = items.get(item_in.item_name)
             
             if not item:
                 raise HTTPException(
@@ -191,8 +281,9 @@ def create_transaction(tx_in: TransactionIn, session: Session = Depends(get_sess
             session.add(transaction_item)
             transaction_items.append(transaction_item)
         
-        # 7. update transaction total amount
+        # 7. update transaction total amount and the daily stats
         new_transaction.total_spent = total_spent
+        record_transactions(session, [(tx_in.created_at, total_spent)])
         
         # 8. commit all changes at once
         session.commit()
@@ -208,11 +299,126 @@ def create_transaction(tx_in: TransactionIn, session: Session = Depends(get_sess
         )
 
 
+# create transactions in batch
+@app.post("/transactions/batch", response_model=List[TransactionBatchResult])
+async def create_transactions_batch(payloads: List[dict]):
+    if len(payloads) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch size {len(payloads)} exceeds the limit of {MAX_BATCH_SIZE}"
+        )
+    return await run_db(insert_transactions_batch, payloads)
+
+def insert_transactions_batch(session: Session, payloads: List[dict]) -> List[TransactionBatchResult]:
+    results: List[TransactionBatchResult | None] = [None] * len(payloads)
+
+    # 1. validate every payload on its own, so one bad row doesn't reject the whole batch
+    valid = []
+    for index, payload in enumerate(payloads):
+        try:
+            valid.append((index, TransactionIn.model_validate(payload)))
+        except ValidationError as e:
+            first_error = e.errors()[0]
+            field = ".".join(str(loc) for loc in first_error["loc"])
+            results[index] = TransactionBatchResult(
+                index=index, status="error", error=f"{field}: {first_error['msg']}" if field else first_error["msg"]
+            )
+
+    try:
+        # 2. resolve payment methods and items through the reference cache,
+        # names missing from the cache are looked up with one query per table
+        payment_methods = reference_cache.get_payment_method_ids(
+            session, {tx_in.payment_method for _, tx_in in valid}
+        )
+        items = reference_cache.get_items(
+            session, {item_in.item_name for _, tx_in in valid for item_in in tx_in.items}
+        )
+
+        # 3. reject transactions referencing unknown payment methods or items
+        accepted = []
+        for index, tx_in in valid:
+            missing_items = [i.item_name for i in tx_in.items if i.item_name not in items]
+            if tx_in.payment_method not in payment_methods:
+                error = f"Payment method not found: {tx_in.payment_method}"
+            elif missing_items:
+                error = f"Item not found: {', '.join(missing_items)}"
+            else:
+                accepted.append((index, tx_in))
+                continue
+            results[index] = TransactionBatchResult(index=index, status="error", error=error)
+
+        if accepted:
+            # 4. upsert customers in bulk, returning ids of new and existing rows alike
+            now = datetime.now()
+            emails = sorted({tx_in.customer_email for _, tx_in in accepted})
+            customer_stmt = upsert_insert(session, Customer).values([
+                {"email": email, "name": email.split('@')[0], "created_at": now, "updated_at": now}
+                for email in emails
+            ])
+            customer_stmt = customer_stmt.on_conflict_do_update(
+                index_elements=[Customer.email],
+                set_={"email": customer_stmt.excluded.email}
+            ).returning(Customer.email, Customer.customer_id)
+            customer_ids = dict(session.exec(customer_stmt).all())
+
+            # 5. build transaction and transaction item rows
+            transaction_rows = []
+            transaction_item_rows = []
+            for index, tx_in in accepted:
+                transaction_id = generate_id()
+                total_spent = 0
+                for item_in in tx_in.items:
+                    item = items[item_in.item_name]
+                    subtotal = item.unit_price * item_in.quantity
+                    total_spent += subtotal
+                    transaction_item_rows.append({
+                        "transaction_id": transaction_id,
+                        "item_id": item.item_id,
+                        "quantity": item_in.quantity,
+                        "unit_price": item.unit_price,
+                        "subtotal": subtotal,
+                        # server time like the single route, the export cursor follows it
+                        "created_at": now
+                    })
+                transaction_rows.append({
+                    "transaction_id": transaction_id,
+                    "customer_id": customer_ids[tx_in.customer_email],
+                    "payment_method_id": payment_methods[tx_in.payment_method],
+                    "location": tx_in.location,
+                    "total_spent": total_spent,
+                    "status": "completed",
+                    "created_at": tx_in.created_at,
+                    "updated_at": tx_in.updated_at
+                })
+                results[index] = TransactionBatchResult(
+                    index=index,
+                    status="created",
+                    transaction_id=transaction_id,
+                    total_spent=total_spent
+                )
+
+            # 6. insert each table with a single statement and commit once
+            session.exec(insert(Transaction).values(transaction_rows))
+            session.exec(insert(TransactionItem).values(transaction_item_rows))
+            record_transactions(session, [(row["created_at"], row["total_spent"]) for row in transaction_rows])
+            session.commit()
+
+    except Exception as e:
+        session.rollback()
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error creating transactions: {str(e)}"
+        )
+
+    return results
+
+
 # create payment method
 @app.post("/payment_methods", response_model=PaymentMethod, status_code=201)
 def create_payment_method(payment_method: PaymentMethod, session: Session = Depends(get_session)):
     session.add(payment_method)
     session.commit()
+    reference_cache.invalidate()
     return payment_method
 
 # create customer
@@ -227,8 +433,24 @@ def create_customer(customer: Customer, session: Session = Depends(get_session))
 def create_item(item: Item, session: Session = Depends(get_session)):
     session.add(item)
     session.commit()
+    reference_cache.invalidate()
     return item
 
+# reference data cache counters
+@app.get("/cache/stats")
+def get_cache_stats():
+    return reference_cache.stats()
+
+# validation error sink counters (queued, dropped, written, failed, pending)
+@app.get("/errors/stats")
+def get_error_sink_stats():
+    return error_sink.stats()
+
+# per-route latency, SQL statement and pool wait histograms, Prometheus text format
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    return PlainTextResponse(request_metrics.render(), media_type="text/plain; version=0.0.4")
+
 # --- error handling ---
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
@@ -236,16 +458,16 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
         body = await request.json()
     except:
         body = {}
+    if not isinstance(body, dict):
+        body = {}
 
-    tx_e = TransactionError(
-        **body,
+    # queued, the sink writes it with the next batch. only the payload columns are
+    # taken from the body, it must not set id, error_message or created_at
+    error_sink.put(TransactionError(
+        **{key: body[key] for key in ERROR_PAYLOAD_FIELDS if key in body},
         error_message=str(exc.errors()),
         created_at=datetime.now()
-    )
-    with Session(engine) as session:
-        session.add(tx_e)
-        session.commit()
-        session.refresh(tx_e)
+    ))
     return JSONResponse(
         status_code=422,
         content={"detail": exc.errors()[0]["msg"], "body": body}
@@ -0,0 +1,328 @@
+# benchmark_api.py
+# repeatable load test of the API. starts the app in-process with uvicorn against
+# a throwaway SQLite file (or the PostgreSQL given with --database-url), seeds it
+# from data/*_sample.json and drives each scenario with a fixed number of
+# requests. every run writes a json result file that can be compared to an
+# earlier one with --compare.
+#   python benchmark_api.py
+#   python benchmark_api.py --database-url postgresql://... --reset --db-mode async
+#   python benchmark_api.py --compare bench_results/<previous>.json
+# async mode on SQLite needs the aiosqlite package.
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from load_sample_data import percentile
+
+# share of each route in the mixed scenario
+MIXED_WEIGHTS = {
+    "POST /transactions": 20,
+    "GET /transactions/{transaction_id}": 50,
+    "GET /transactions/count": 20,
+    "GET /transactions": 10,
+}
+BATCH_SIZE = 50
+DATA_DIR = Path(__file__).parent / "data"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="load test and latency benchmark for the API")
+    parser.add_argument("--database-url", help="defaults to a new SQLite file in a temp directory")
+    parser.add_argument("--reset", action="store_true", help="drop and recreate all tables first (required for a non-empty database)")
+    parser.add_argument("--db-mode", choices=["sync", "async"], default="sync")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--scenarios", default="create,batch,get_by_id,count,list,mixed",
+                        help="comma separated subset of: create,batch,get_by_id,count,list,mixed")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--output-dir", default="bench_results")
+    parser.add_argument("--compare", help="earlier result file to diff against")
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args()
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).parent, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except Exception:
+        return None
+
+
+class StatementCounter:
+    """counts SQL statements sent through an engine"""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs):
+        with self._lock:
+            self.count += 1
+
+
+class Driver:
+    """closed-loop load generator: `concurrency` workers send requests back to back"""
+
+    def __init__(self, base_url: str, concurrency: int):
+        self.base_url = base_url
+        self.concurrency = concurrency
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.http.mount("http://", adapter)
+
+    def run(self, requests_to_send: list[tuple[str, str, str, object]]) -> dict:
+        """requests_to_send is a list of (route label, method, path, json body)"""
+        latencies: dict[str, list[float]] = {}
+        errors: dict[str, int] = {}
+        lock = threading.Lock()
+
+        def send(request):
+            route, method, path, body = request
+            started = time.perf_counter()
+            try:
+                response = self.http.request(method, f"{self.base_url}{path}", json=body)
+                ok = response.status_code < 400
+            except Exception:
+                ok = False
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                latencies.setdefault(route, []).append(elapsed)
+                if not ok:
+                    errors[route] = errors.get(route, 0) + 1
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            list(pool.map(send, requests_to_send))
+        seconds = time.perf_counter() - started
+
+        return {
+            "seconds": round(seconds, 3),
+            "routes": {
+                route: {
+                    "requests": len(values),
+                    "errors": errors.get(route, 0),
+                    "p50_ms": round(percentile(values, 50), 2),
+                    "p95_ms": round(percentile(values, 95), 2),
+                    "p99_ms": round(percentile(values, 99), 2),
+                    "mean_ms": round(sum(values) / len(values), 2),
+                }
+                for route, values in latencies.items()
+            },
+        }
+
+
+# per-route SQL statement counters exposed by request_metrics.py on /metrics
+STATEMENTS_SERIES = re.compile(
+    r'^http_request_db_statements_(sum|count)\{method="([^"]*)",route="([^"]*)"\} (\S+)$', re.MULTILINE
+)
+
+
+def route_statement_counters(base_url: str) -> dict[str, dict[str, float]]:
+    """statements executed and requests served so far per route, keyed like the scenario routes"""
+    counters: dict[str, dict[str, float]] = {}
+    text = requests.get(f"{base_url}/metrics").text
+    for kind, method, route, value in STATEMENTS_SERIES.findall(text):
+        counters.setdefault(f"{method} {route}", {"sum": 0.0, "count": 0.0})[kind] = float(value)
+    return counters
+
+
+def load_sample(filename: str, key: str) -> list[dict]:
+    return json.loads((DATA_DIR / filename).read_text(encoding="utf-8"))[key]
+
+
+def seed_reference_data(engine) -> None:
+    """insert the sample items, payment methods and customers into empty tables"""
+    from sqlmodel import Session, select
+    from models import Item, PaymentMethod, Customer
+
+    with Session(engine) as session:
+        for model, filename, key in [
+            (Item, "items_sample.json", "items"),
+            (PaymentMethod, "payment_methods_sample.json", "payment_methods"),
+            (Customer, "customers_sample.json", "customers"),
+        ]:
+            if session.exec(select(model)).first() is None:
+                # table models skip validation, so parse the timestamps here
+                session.add_all(
+                    model(**{k: datetime.fromisoformat(v) if k.endswith("_at") else v for k, v in row.items()})
+                    for row in load_sample(filename, key)
+                )
+        session.commit()
+
+
+def build_scenarios(transactions: list[dict], transaction_ids: list[str], n: int, rng: random.Random) -> dict:
+    def create(i):
+        return ("POST /transactions", "POST", "/transactions", transactions[i % len(transactions)])
+
+    def get_by_id(i):
+        return ("GET /transactions/{transaction_id}", "GET", f"/transactions/{rng.choice(transaction_ids)}", None)
+
+    def count(i):
+        return ("GET /transactions/count", "GET", "/transactions/count", None)
+
+    def list_page(i):
+        return ("GET /transactions", "GET", "/transactions?limit=100", None)
+
+    def batch(i):
+        start = (i * BATCH_SIZE) % len(transactions)
+        return ("POST /transactions/batch", "POST", "/transactions/batch", transactions[start:start + BATCH_SIZE])
+
+    factories = {
+        "POST /transactions": create,
+        "GET /transactions/{transaction_id}": get_by_id,
+        "GET /transactions/count": count,
+        "GET /transactions": list_page,
+    }
+    routes = list(MIXED_WEIGHTS)
+    mixed_routes = rng.choices(routes, weights=[MIXED_WEIGHTS[r] for r in routes], k=n)
+
+    return {
+        "create": [create(i) for i in range(n)],
+        # each batch request carries BATCH_SIZE transactions
+        "batch": [batch(i) for i in range(max(n // BATCH_SIZE, 1))],
+        "get_by_id": [get_by_id(i) for i in range(n)],
+        "count": [count(i) for i in range(n)],
+        "list": [list_page(i) for i in range(n)],
+        "mixed": [factories[route](i) for i, route in enumerate(mixed_routes)],
+    }
+
+
+def print_results(results: dict, previous: dict | None) -> None:
+    print(f"\n{'scenario':<12}{'route':<38}{'req':>6}{'err':>5}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}{'stmt/req':>10}")
+    for name, scenario in results["scenarios"].items():
+        for route, r in scenario["routes"].items():
+            line = (
+                f"{name:<12}{route:<38}{r['requests']:>6}{r['errors']:>5}"
+                f"{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}"
+                f"{r['requests_per_second']:>9.1f}{r['statements_per_request']:>10.2f}"
+            )
+            before = (previous or {}).get("scenarios", {}).get(name, {}).get("routes", {}).get(route)
+            if before:
+                change = (r["p95_ms"] - before["p95_ms"]) / before["p95_ms"] * 100 if before["p95_ms"] else 0.0
+                line += f"   p95 {change:+.1f}% vs {previous['meta'].get('commit')}"
+            print(line)
+        total = sum(r["requests"] for r in scenario["routes"].values())
+        errors = sum(r["errors"] for r in scenario["routes"].values())
+        print(
+            f"{name:<12}{'total':<38}{total:>6}{errors:>5}{'':>27}"
+            f"{scenario['requests_per_second']:>9.1f}{scenario['statements_per_request']:>10.2f}"
+        )
+
+
+def main():
+    args = parse_args()
+    rng = random.Random(args.seed)
+
+    tmp_dir = None
+    database_url = args.database_url
+    if database_url is None:
+        tmp_dir = tempfile.TemporaryDirectory(prefix="coffee-bench-")
+        database_url = f"sqlite:///{Path(tmp_dir.name) / 'bench.db'}"
+
+    # configure the app before importing it, database.py reads these at import
+    os.environ["DATABASE_URL"] = database_url
+    os.environ["DB_MODE"] = args.db_mode
+    os.environ["STATIC_BOOTSTRAP"] = "skip"
+
+    import uvicorn
+    from sqlalchemy import event
+    from sqlmodel import SQLModel
+    import app as api
+    from database import engine, async_engine
+
+    if args.reset:
+        SQLModel.metadata.drop_all(engine)
+
+    counter = StatementCounter()
+    event.listen(engine, "before_cursor_execute", counter)
+    if async_engine is not None:
+        event.listen(async_engine.sync_engine, "before_cursor_execute", counter)
+
+    server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=args.port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            sys.exit("❌ the API failed to start")
+        time.sleep(0.05)
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    try:
+        seed_reference_data(engine)
+        transactions = load_sample("transactions_sample.json", "transactions")
+        # warm-up batch, also gives get_by_id real ids to look up
+        warmup = requests.post(f"{base_url}/transactions/batch", json=transactions[:200]).json()
+        transaction_ids = [r["transaction_id"] for r in warmup if r["status"] == "created"]
+        if not transaction_ids:
+            sys.exit("❌ seeding failed, no transaction could be created")
+
+        scenarios = build_scenarios(transactions, transaction_ids, args.requests, rng)
+        driver = Driver(base_url, args.concurrency)
+        selected = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+
+        results = {
+            "meta": {
+                "commit": git_commit(),
+                "timestamp": datetime.now().isoformat(timespec="seconds"),
+                "database": engine.dialect.name,
+                "db_mode": args.db_mode,
+                "concurrency": args.concurrency,
+                "requests_per_scenario": args.requests,
+                "python": platform.python_version(),
+            },
+            "scenarios": {},
+        }
+        for name in selected:
+            print(f"▶️ running {name} ({len(scenarios[name])} requests)...")
+            statements_before = counter.count
+            routes_before = route_statement_counters(base_url)
+            result = driver.run(scenarios[name])
+            routes_after = route_statement_counters(base_url)
+            for route, r in result["routes"].items():
+                # the routes of a scenario run concurrently, so each one's share of the throughput
+                r["requests_per_second"] = round(r["requests"] / result["seconds"], 1) if result["seconds"] else 0.0
+                before = routes_before.get(route, {"sum": 0.0, "count": 0.0})
+                after = routes_after.get(route, before)
+                served = after["count"] - before["count"]
+                r["statements_per_request"] = round((after["sum"] - before["sum"]) / served, 2) if served else 0.0
+            total_requests = sum(r["requests"] for r in result["routes"].values())
+            result["requests_per_second"] = round(total_requests / result["seconds"], 1) if result["seconds"] else 0.0
+            result["statements_per_request"] = round((counter.count - statements_before) / total_requests, 2)
+            results["scenarios"][name] = result
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%dT%H%M%S")
+    output = output_dir / f"{stamp}-{results['meta']['commit'] or 'nocommit'}-{engine.dialect.name}-{args.db_mode}.json"
+    output.write_text(json.dumps(results, indent=2))
+
+    previous = json.loads(Path(args.compare).read_text()) if args.compare else None
+    print_results(results, previous)
+    print(f"\n📄 results written to {output}")
+
+    if tmp_dir is not None:
+        engine.dispose()
+        tmp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+# benchmark_ids.py
+# insert throughput of the transaction id schemes. fills one table per scheme,
+# keyed on transaction_id like transactions and transaction_items, in batches
+# and reports rows/sec at the start and at the end of the fill, where random
+# keys have to hit leaf pages all over the index. writes a json result file
+# like benchmark_api.py.
+#   python benchmark_ids.py
+#   python benchmark_ids.py --rows 2000000 --database-url postgresql://...
+import argparse
+import hashlib
+import json
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy import create_engine, event, text
+
+from benchmark_api import git_commit
+from ids import IdGenerator
+
+
+def legacy_id() -> str:
+    """the scheme used before ids.py: sha256 of a uuid4, truncated"""
+    return hashlib.sha256(uuid.uuid4().hex.encode()).hexdigest()[:16]
+
+
+SCHEMES = {
+    "sha256_uuid4": lambda: legacy_id,
+    "time_ordered": IdGenerator,
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="insert throughput of random vs time-ordered transaction ids")
+    parser.add_argument("--database-url", help="defaults to a new SQLite file in a temp directory")
+    parser.add_argument("--rows", type=int, default=500000, help="rows inserted per scheme")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--output-dir", default="bench_results")
+    return parser.parse_args()
+
+
+def generation_rate(make_id, count: int = 100000) -> float:
+    started = time.perf_counter()
+    for _ in range(count):
+        make_id()
+    return count / (time.perf_counter() - started)
+
+
+def fill(engine, table: str, make_id, rows: int, batch_size: int) -> list[float]:
+    """insert rows in batches, one commit per batch, returns the rows/sec of every batch"""
+    with engine.begin() as connection:
+        connection.exec_driver_sql(f"DROP TABLE IF EXISTS {table}")
+        connection.exec_driver_sql(
+            f"CREATE TABLE {table} (transaction_id VARCHAR(16) PRIMARY KEY, item_id INTEGER NOT NULL, quantity INTEGER NOT NULL)"
+        )
+        connection.exec_driver_sql(f"CREATE INDEX idx_{table}_item ON {table} (transaction_id, item_id)")
+
+    statement = text(f"INSERT INTO {table} (transaction_id, item_id, quantity) VALUES (:transaction_id, :item_id, :quantity)")
+    rates = []
+    for start in range(0, rows, batch_size):
+        batch = [
+            {"transaction_id": make_id(), "item_id": (start + i) % 8 + 1, "quantity": 1}
+            for i in range(min(batch_size, rows - start))
+        ]
+        started = time.perf_counter()
+        with engine.begin() as connection:
+            connection.execute(statement, batch)
+        rates.append(len(batch) / (time.perf_counter() - started))
+
+    with engine.begin() as connection:
+        connection.exec_driver_sql(f"DROP TABLE {table}")
+    return rates
+
+
+def summarize(rates: list[float]) -> dict:
+    tenth = max(1, len(rates) // 10)
+    return {
+        "overall_rows_per_second": round(len(rates) / sum(1 / rate for rate in rates), 1),
+        "first_10pct_rows_per_second": round(sum(rates[:tenth]) / tenth, 1),
+        "last_10pct_rows_per_second": round(sum(rates[-tenth:]) / tenth, 1),
+    }
+
+
+def main():
+    args = parse_args()
+    tmp_dir = None
+    database_url = args.database_url
+    if database_url is None:
+        tmp_dir = tempfile.TemporaryDirectory(prefix="coffee-bench-ids-")
+        database_url = f"sqlite:///{Path(tmp_dir.name) / 'bench_ids.db'}"
+    engine = create_engine(database_url)
+    if engine.dialect.name == "sqlite":
+        # a small page cache, like a table that outgrew shared_buffers
+        @event.listens_for(engine, "connect")
+        def small_cache(dbapi_connection, _):
+            dbapi_connection.execute("PRAGMA cache_size = -8000")
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "database": engine.dialect.name,
+            "rows": args.rows,
+            "batch_size": args.batch_size,
+        },
+        "schemes": {},
+    }
+    try:
+        for name, make_generator in SCHEMES.items():
+            print(f"▶️ {name}: inserting {args.rows} rows...")
+            make_id = make_generator()
+            result = summarize(fill(engine, f"bench_ids_{name}", make_id, args.rows, args.batch_size))
+            result["ids_per_second"] = round(generation_rate(make_id), 1)
+            results["schemes"][name] = result
+    finally:
+        engine.dispose()
+        if tmp_dir is not None:
+            tmp_dir.cleanup()
+
+    print(f"\n{'scheme':<16}{'ids/s':>12}{'rows/s':>12}{'first 10%':>12}{'last 10%':>12}")
+    for name, r in results["schemes"].items():
+        print(
+            f"{name:<16}{r['ids_per_second']:>12.0f}{r['overall_rows_per_second']:>12.0f}"
+            f"{r['first_10pct_rows_per_second']:>12.0f}{r['last_10pct_rows_per_second']:>12.0f}"
+        )
+
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%dT%H%M%S")
+    output = output_dir / f"{stamp}-{results['meta']['commit'] or 'nocommit'}-{engine.dialect.name}-ids.json"
+    output.write_text(json.dumps(results, indent=2))
+    print(f"\n📄 results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# database.py
+# engines and sessions for the API. DB_MODE selects which engine serves the
+# transaction routes:
+#   sync  - blocking Session(engine), run on the threadpool
+#   async - AsyncSession(async_engine) on the event loop (asyncpg / aiosqlite)
+# the sync engine is always created, it serves startup and the admin routes.
+from sqlalchemy import Connection, make_url
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from request_metrics import record_pool_wait
+from dotenv import load_dotenv
+from typing import Any, Callable, TypeVar
+import os
+import time
+
+load_dotenv()
+
+T = TypeVar("T")
+
+# --- environment variables ---
+DATABASE_URL = os.getenv("DATABASE_URL")
+DB_MODE = os.getenv("DB_MODE", "sync")  # sync, async
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+if DB_MODE not in ("sync", "async"):
+    raise ValueError(f"DB_MODE must be either 'sync' or 'async', got: {DB_MODE}")
+
+# async driver for each supported backend
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+def to_async_url(database_url: str) -> str:
+    url = make_url(database_url)
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()]).render_as_string(hide_password=False)
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or to_async_url(DATABASE_URL)
+
+def pool_options(database_url: str) -> dict:
+    """QueuePool sizing, left out for in-memory SQLite: its SingletonThreadPool /
+    StaticPool reject these arguments"""
+    url = make_url(database_url)
+    if url.get_backend_name() == "sqlite" and (
+        url.database in (None, "", ":memory:") or url.query.get("mode") == "memory"
+    ):
+        return {}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+    }
+
+# --- create engines ---
+engine = create_engine(DATABASE_URL, **pool_options(DATABASE_URL))
+async_engine = (
+    create_async_engine(ASYNC_DATABASE_URL, **pool_options(ASYNC_DATABASE_URL)) if DB_MODE == "async" else None
+)
+
+# --- create session ---
+def get_session():
+    with Session(engine) as session:
+        checkout_connection(session)
+        yield session
+
+def checkout_connection(session: Session):
+    """take the session's connection from the pool now and record how long that took"""
+    started = time.perf_counter()
+    session.connection()
+    record_pool_wait(time.perf_counter() - started)
+
+def upsert_insert(session: Session | Connection, table):
+    """INSERT that supports on_conflict_do_update / do_nothing on the session's (or connection's) backend"""
+    bind = session if isinstance(session, Connection) else session.get_bind()
+    if bind.dialect.name == "sqlite":
+        return sqlite.insert(table)
+    return postgresql.insert(table)
+
+async def run_db(fn: Callable[..., T], *args: Any) -> T:
+    """Run fn(session, *args) on the engine selected by DB_MODE.
+
+    fn is written against the regular Session API. In async mode it runs through
+    AsyncSession.run_sync, so every statement awaits the async driver instead of
+    blocking a thread.
+    """
+    if DB_MODE == "async":
+        async with AsyncSession(async_engine) as session:
+            started = time.perf_counter()
+            await session.connection()
+            record_pool_wait(time.perf_counter() - started)
+            return await session.run_sync(fn, *args)
+
+    def call() -> T:
+        with Session(engine) as session:
+            checkout_connection(session)
+            return fn(session, *args)
+
+    return await run_in_threadpool(call)
@@ -0,0 +1,152 @@
+# error_sink.py
+# buffered writer for the transactions_errors table. the validation error handler
+# only queues the record in memory, a background task inserts the queued records
+# in batches, so a flood of bad payloads costs one INSERT per batch instead of a
+# session, an INSERT and a commit per request on the event loop.
+from sqlalchemy import String, insert
+from sqlmodel import Session
+from database import run_db
+from models import TransactionError
+import asyncio
+import collections
+import json
+
+# text columns of transactions_errors and their length limit (None when unbounded),
+# sqlmodel declares str fields as AutoString, a TypeDecorator over String
+TEXT_COLUMNS = {
+    column.name: column.type.length
+    for column in TransactionError.__table__.columns
+    if isinstance(getattr(column.type, "impl", column.type), String)
+}
+
+
+def coerce_error_row(row: dict) -> dict:
+    """fit the payload values to the text columns, a bad request can send any JSON there"""
+    coerced = dict(row)
+    for name, length in TEXT_COLUMNS.items():
+        value = coerced.get(name)
+        if value is None:
+            continue
+        if not isinstance(value, str):
+            value = json.dumps(value, default=str) if isinstance(value, (dict, list)) else str(value)
+        coerced[name] = value[:length] if length else value
+    return coerced
+
+
+def insert_errors(session: Session, rows: list[dict]) -> None:
+    session.exec(insert(TransactionError).values(rows))
+    session.commit()
+
+
+def insert_errors_one_by_one(session: Session, rows: list[dict]) -> int:
+    """insert and commit each row on its own, returns how many were written"""
+    written = 0
+    for row in rows:
+        try:
+            session.exec(insert(TransactionError).values([row]))
+            session.commit()
+            written += 1
+        except Exception as e:
+            session.rollback()
+            print(f"❌ failed to write validation error {row.get('transaction_id')}: {str(e)}")
+    return written
+
+
+class ValidationErrorSink:
+    """Queues TransactionError records and flushes them in batches.
+
+    The queue holds at most `max_queued` records, records arriving when it is full
+    are dropped and counted. Values are fitted to the column types when queued. A
+    flush runs every `flush_seconds`, or as soon as `batch_size` records are
+    waiting. A batch that fails to insert is retried row by row, so one bad record
+    does not take the batch with it. Rows that still fail are dropped and counted,
+    so a broken database never grows the queue. `stop()` flushes what is left,
+    call it on shutdown.
+    """
+
+    def __init__(self, max_queued: int = 10000, batch_size: int = 500, flush_seconds: float = 1.0):
+        self.max_queued = max_queued
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        # only touched from the event loop, no lock needed
+        self._queue: collections.deque[dict] = collections.deque()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task: asyncio.Task | None = None
+        self._counters = {
+            "queued": 0,
+            "dropped": 0,
+            "written": 0,
+            "failed": 0,
+            "flushes": 0,
+        }
+
+    # --- public API ---
+    def put(self, error: TransactionError) -> bool:
+        """queue the record, False when it was dropped because the queue is full"""
+        if len(self._queue) >= self.max_queued:
+            self._counters["dropped"] += 1
+            return False
+        self._queue.append(coerce_error_row(error.model_dump(exclude={"id"})))
+        self._counters["queued"] += 1
+        if len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def start(self) -> None:
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run(), name="validation-error-sink")
+
+    async def stop(self) -> None:
+        """stop the background task and write everything still queued"""
+        if self._task is not None:
+            # not cancelled: a flush in flight has already popped its batch off the
+            # queue, the task finishes it and exits at the next check
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        while self._queue:
+            await self.flush()
+
+    async def flush(self) -> int:
+        """insert up to batch_size queued records, returns how many were written"""
+        batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+        if not batch:
+            return 0
+        self._counters["flushes"] += 1
+        try:
+            await run_db(insert_errors, batch)
+            written = len(batch)
+        except Exception as e:
+            print(f"❌ failed to write {len(batch)} validation errors, retrying one by one: {str(e)}")
+            try:
+                written = await run_db(insert_errors_one_by_one, batch)
+            except Exception as e:
+                print(f"❌ failed to write {len(batch)} validation errors: {str(e)}")
+                written = 0
+        self._counters["written"] += written
+        self._counters["failed"] += len(batch) - written
+        return written
+
+    def stats(self) -> dict:
+        return {
+            **self._counters,
+            "pending": len(self._queue),
+            "max_queued": self.max_queued,
+            "batch_size": self.batch_size,
+            "flush_seconds": self.flush_seconds,
+        }
+
+    # --- internals ---
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            # drain full batches right away, a partial one waits for the next tick
+            while await self.flush() == self.batch_size and len(self._queue) >= self.batch_size:
+                pass
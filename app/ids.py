@@ -0,0 +1,76 @@
+# ids.py
+# time-ordered 16 character ids for transaction primary keys. ids generated later
+# sort after earlier ones, so inserts append to the right edge of the primary key
+# and transaction_id indexes instead of landing on a random leaf page.
+#
+# layout of the 80 bit value, written as 16 chars of lowercase Crockford base32
+# (sorts the same as the values it encodes):
+#   42 bits  milliseconds since the unix epoch, enough until the year 2109
+#   38 bits  random tail, incremented for ids in the same millisecond
+import os
+import threading
+import time
+
+ALPHABET = "0123456789abcdefghjkmnpqrstvwxyz"
+ID_LENGTH = 16
+TIME_BITS = 42
+TAIL_BITS = ID_LENGTH * 5 - TIME_BITS
+# a new millisecond starts its tail in the lower half, so the increments of a
+# busy millisecond never run out of room in practice
+TAIL_START_MAX = 1 << (TAIL_BITS - 1)
+
+
+def _encode(value: int, length: int) -> str:
+    chars = []
+    for _ in range(length):
+        value, index = divmod(value, 32)
+        chars.append(ALPHABET[index])
+    return "".join(reversed(chars))
+
+
+class IdGenerator:
+    """Monotonic ids: within a process every id sorts after the previous one.
+
+    Ids made in the same millisecond keep the random tail of the first one and
+    increment it. When the tail is exhausted the timestamp part moves ahead by one
+    millisecond, and a clock that went backwards keeps the last timestamp, so ids
+    never repeat within a process. Other processes start their tails at independent random
+    values, two of them collide only if they draw tails within each other's
+    increments in the same millisecond.
+    """
+
+    def __init__(self):
+        self._reset()
+        # a forked worker must not continue the parent's tail
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._tail = 0
+
+    def __call__(self) -> str:
+        now_ms = time.time_ns() // 1_000_000
+        with self._lock:
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                self._tail = int.from_bytes(os.urandom(5), "big") % TAIL_START_MAX
+            else:
+                self._tail += 1
+                if self._tail >> TAIL_BITS:
+                    self._last_ms += 1
+                    self._tail = int.from_bytes(os.urandom(5), "big") % TAIL_START_MAX
+            ms, tail = self._last_ms, self._tail
+        return _encode(ms << TAIL_BITS | tail, ID_LENGTH)
+
+
+def id_timestamp_ms(value: str) -> int:
+    """milliseconds since the epoch encoded in an id made by generate_id"""
+    encoded = 0
+    for char in value:
+        encoded = encoded * 32 + ALPHABET.index(char)
+    return encoded >> TAIL_BITS
+
+
+# shared by the API, the models and the loaders
+generate_id = IdGenerator()
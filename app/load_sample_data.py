@@ -1,88 +1,192 @@
+import argparse
 import json
+import threading
+import time
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
+from requests.adapters import HTTPAdapter
+
+
+def percentile(values: list[float], p: float) -> float:
+    """nearest-rank percentile of values, 0 if empty"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(int(round(p / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+@dataclass
+class StageStats:
+    name: str
+    records: int = 0
+    requests: int = 0
+    errors: int = 0
+    seconds: float = 0.0
+    latencies_ms: list[float] = field(default_factory=list)
+    error_samples: list[str] = field(default_factory=list)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add_request(self, latency_ms: float) -> None:
+        with self.lock:
+            self.requests += 1
+            self.latencies_ms.append(latency_ms)
+
+    def add_error(self, message: str, count: int = 1) -> None:
+        with self.lock:
+            self.errors += count
+            if len(self.error_samples) < 5:
+                self.error_samples.append(message)
+
 
 class SampleDataLoader:
-    def __init__(self, base_url: str = "http://localhost:8000"):
+    def __init__(self, base_url: str = "http://localhost:8000", concurrency: int = 8,
+                 batch_size: int = 0, data_dir: str = "data"):
         self.base_url = base_url
-        self.data_dir = Path("data")
+        self.data_dir = Path(data_dir)
+        self.concurrency = max(concurrency, 1)
+        self.batch_size = batch_size
+        self.stats: list[StageStats] = []
+
+        # one keep-alive connection per worker thread
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self.http.mount("http://", adapter)
+        self.http.mount("https://", adapter)
 
     def load_json(self, filename: str) -> dict:
         with open(self.data_dir / filename, 'r', encoding='utf-8') as f:
             return json.load(f)
 
+    def post(self, stats: StageStats, path: str, payload) -> requests.Response | None:
+        """post one request, record its latency and transport errors"""
+        started = time.perf_counter()
+        try:
+            response = self.http.post(f"{self.base_url}{path}", json=payload)
+        except Exception as e:
+            stats.add_error(str(e))
+            return None
+        finally:
+            stats.add_request((time.perf_counter() - started) * 1000)
+        return response
+
+    def run_stage(self, name: str, path: str, records: list[dict], label: str) -> StageStats:
+        """post every record to path with the configured concurrency"""
+        stats = StageStats(name=name, records=len(records))
+
+        def send(record: dict) -> None:
+            response = self.post(stats, path, record)
+            if response is not None and response.status_code != 201:
+                stats.add_error(f"{record.get(label)}: {response.status_code} {response.text[:200]}")
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            list(pool.map(send, records))
+        stats.seconds = time.perf_counter() - started
+        self.stats.append(stats)
+        return stats
+
+    def run_batch_stage(self, name: str, records: list[dict]) -> StageStats | None:
+        """post transactions to /transactions/batch, None if the API has no batch endpoint"""
+        stats = StageStats(name=f"{name} (batch of {self.batch_size})", records=len(records))
+        batches = [records[i:i + self.batch_size] for i in range(0, len(records), self.batch_size)]
+
+        def send(batch: list[dict]) -> bool:
+            response = self.post(stats, "/transactions/batch", batch)
+            if response is None:
+                return True
+            if response.status_code in (404, 405):
+                return False
+            if response.status_code != 200:
+                stats.add_error(f"{response.status_code} {response.text[:200]}", count=len(batch))
+                return True
+            for result in response.json():
+                if result["status"] != "created":
+                    stats.add_error(f"{batch[result['index']].get('customer_email')}: {result['error']}")
+            return True
+
+        started = time.perf_counter()
+        # the first batch doubles as a probe for the endpoint
+        if not send(batches[0]):
+            print("⚠️ /transactions/batch is not available, falling back to single requests")
+            return None
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            list(pool.map(send, batches[1:]))
+        stats.seconds = time.perf_counter() - started
+        self.stats.append(stats)
+        return stats
+
     def load_items(self) -> None:
         """load item data"""
         data = self.load_json("items_sample.json")
-        print("start loading item data...")
-        
-        for item in data["items"]:
-            try:
-                response = requests.post(f"{self.base_url}/items", json=item)
-                if response.status_code == 201:
-                    print(f"✅ successfully create item: {item['name']}")
-                else:
-                    print(f"❌ failed to create item {item['name']}: {response.text}")
-            except Exception as e:
-                print(f"❌ failed to create item {item['name']}: {str(e)}")
+        self.run_stage("items", "/items", data["items"], label="name")
 
     def load_payment_methods(self) -> None:
         """load payment method"""
         data = self.load_json("payment_methods_sample.json")
-        print("start loading payment method...")
-        
-        for pm in data["payment_methods"]:
-            try:
-                response = requests.post(f"{self.base_url}/payment_methods", json=pm)
-                if response.status_code == 201:
-                    print(f"✅ successfully create payment method: {pm['name']}")
-                else:
-                    print(f"❌ failed to create payment method {pm['name']}: {response.text}")
-            except Exception as e:
-                print(f"❌ failed to create payment method {pm['name']}: {str(e)}")
+        self.run_stage("payment_methods", "/payment_methods", data["payment_methods"], label="name")
 
     def load_customers(self) -> None:
         """load customer data"""
         data = self.load_json("customers_sample.json")
-        print("start loading customer data...")
-        
-        for customer in data["customers"]:
-            try:
-                response = requests.post(f"{self.base_url}/customers", json=customer)
-                if response.status_code == 201:
-                    print(f"✅ successfully create customer: {customer['email']}")
-                else:
-                    print(f"❌ failed to create customer {customer['email']}: {response.text}")
-            except Exception as e:
-                print(f"❌ failed to create customer {customer['email']}: {str(e)}")
+        self.run_stage("customers", "/customers", data["customers"], label="email")
 
     def load_transactions(self) -> None:
         """load transaction data"""
         data = self.load_json("transactions_sample.json")
-        print("start loading transaction data...")
-        
-        for tx in data["transactions"]:
-            try:
-                response = requests.post(f"{self.base_url}/transactions", json=tx)
-                if response.status_code == 201:
-                    print(f"✅ successfully create transaction: {tx['customer_email']}")
-                else:
-                    print(f"❌ failed to create transaction {tx['customer_email']}: {response.text}")
-            except Exception as e:
-                print(f"❌ failed to create transaction {tx['customer_email']}: {str(e)}")
+        transactions = data["transactions"]
+        if self.batch_size > 0 and transactions:
+            if self.run_batch_stage("transactions", transactions) is not None:
+                return
+        self.run_stage("transactions", "/transactions", transactions, label="customer_email")
+
+    def print_summary(self) -> None:
+        print(
+            f"\n{'stage':<32}{'records':>9}{'requests':>10}{'errors':>8}{'seconds':>9}"
+            f"{'rec/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+        )
+        for s in self.stats:
+            throughput = s.records / s.seconds if s.seconds else 0.0
+            print(
+                f"{s.name:<32}{s.records:>9}{s.requests:>10}{s.errors:>8}{s.seconds:>9.2f}"
+                f"{throughput:>9.1f}{percentile(s.latencies_ms, 50):>9.1f}"
+                f"{percentile(s.latencies_ms, 95):>9.1f}{percentile(s.latencies_ms, 99):>9.1f}"
+            )
+        for s in self.stats:
+            for sample in s.error_samples:
+                print(f"❌ {s.name}: {sample}")
 
     def load_all(self) -> None:
         """load all sample data"""
-        print("start loading all sample data...")
-        
-        # load data in order of dependency
+        print(f"start loading all sample data (concurrency={self.concurrency}, batch_size={self.batch_size})...")
+        started = time.perf_counter()
+
+        # load data in order of dependency, each stage finishes before the next starts
         self.load_items()
         self.load_payment_methods()
         self.load_customers()
         self.load_transactions()
-        
-        print("\n✨ successfully load all sample data!")
+
+        self.print_summary()
+        total_errors = sum(s.errors for s in self.stats)
+        print(f"\n✨ finished loading sample data in {time.perf_counter() - started:.2f}s with {total_errors} errors")
+
 
 if __name__ == "__main__":
-    loader = SampleDataLoader()
-    loader.load_all()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="load the sample json data through the API")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=8, help="requests in flight at once")
+    parser.add_argument("--batch-size", type=int, default=0,
+                        help="transactions per /transactions/batch request, 0 posts them one by one")
+    parser.add_argument("--data-dir", default="data")
+    args = parser.parse_args()
+
+    loader = SampleDataLoader(
+        base_url=args.base_url,
+        concurrency=args.concurrency,
+        batch_size=args.batch_size,
+        data_dir=args.data_dir
+    )
+    loader.load_all()
@@ -0,0 +1,201 @@
+# load_static_data.py
+# bulk load of the historical kaggle csv into transactions_static.
+# rows are streamed in chunks: valid rows go in with COPY, rejected rows are
+# written to transactions_errors in one batch per chunk, and every chunk is
+# committed on its own. a finished load is recorded in static_loads, a load that
+# stopped halfway is resumed on the next run, rows already loaded are skipped.
+# --force loads the file again after it finished. can run inside the API
+# (see STATIC_BOOTSTRAP in app.py) or on its own:
+#   python load_static_data.py --csv data/cafe_sales_kaggle.csv
+from sqlalchemy import create_engine, delete, insert, select, text, Engine
+from sqlmodel import SQLModel
+from database import upsert_insert
+from models import Transaction_STATIC, TransactionError, StaticLoad
+from dotenv import load_dotenv
+from datetime import datetime
+import argparse
+import csv
+import io
+import os
+import time
+
+# csv header -> transactions_static column
+COLUMN_MAP = {
+    "Transaction ID": "transaction_id",
+    "Item": "item",
+    "Quantity": "quantity",
+    "Price Per Unit": "price_per_unit",
+    "Total Spent": "total_spent",
+    "Payment Method": "payment_method",
+    "Location": "location",
+    "Transaction Date": "transaction_date",
+}
+COLUMNS = list(COLUMN_MAP.values())
+STATIC_TABLE = Transaction_STATIC.__table__
+ERRORS_TABLE = TransactionError.__table__
+LOADS_TABLE = StaticLoad.__table__
+MAX_LENGTHS = {name: STATIC_TABLE.c[name].type.length for name in COLUMNS}
+DEFAULT_CHUNK_SIZE = 50_000
+
+
+def validate_row(row: dict) -> str | None:
+    """return the reason the row is rejected, None if it can be loaded"""
+    if not row["transaction_id"]:
+        return "missing transaction_id"
+    for name, value in row.items():
+        max_length = MAX_LENGTHS[name]
+        if max_length and len(value) > max_length:
+            return f"{name} longer than {max_length} characters: {value}"
+    return None
+
+
+def read_chunks(f, chunk_size: int):
+    """yield (valid_rows, rejected_rows) for every chunk_size lines of the csv"""
+    reader = csv.reader(f)
+    header = next(reader)
+    missing = set(COLUMN_MAP) - set(header)
+    if missing:
+        raise ValueError(f"CSV is missing columns: {sorted(missing)}")
+    positions = [header.index(source) for source in COLUMN_MAP]
+
+    valid, rejected = [], []
+    for values in reader:
+        if len(values) != len(header):
+            rejected.append((dict(zip(COLUMNS, values)), f"expected {len(header)} columns, got {len(values)}"))
+        else:
+            row = {name: values[i] for name, i in zip(COLUMNS, positions)}
+            error = validate_row(row)
+            if error:
+                rejected.append((row, error))
+            else:
+                valid.append(row)
+        if len(valid) + len(rejected) >= chunk_size:
+            yield valid, rejected
+            valid, rejected = [], []
+    if valid or rejected:
+        yield valid, rejected
+
+
+def error_records(rejected: list, created_at: datetime) -> list[dict]:
+    records = []
+    for row, error in rejected:
+        transaction_id = row.get("transaction_id")
+        records.append({
+            **{name: row.get(name) for name in COLUMNS if name != "transaction_id"},
+            # keep the record insertable even when the id itself was the problem
+            "transaction_id": transaction_id if transaction_id and len(transaction_id) <= 16 else None,
+            "error_message": error,
+            "created_at": created_at,
+        })
+    return records
+
+
+def copy_rows(connection, rows: list[dict]) -> int:
+    """COPY rows into transactions_static through a temp table, duplicates are skipped"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row[name] for name in COLUMNS])
+    buffer.seek(0)
+
+    columns = ", ".join(COLUMNS)
+    cursor = connection.connection.cursor()
+    try:
+        # empty csv values stay empty strings, like the ORM import stored them
+        cursor.copy_expert(
+            f"COPY transactions_static_load ({columns}) FROM STDIN "
+            f"WITH (FORMAT csv, FORCE_NOT_NULL ({columns}))",
+            buffer
+        )
+    finally:
+        cursor.close()
+    inserted = connection.execute(text(
+        f"INSERT INTO transactions_static ({columns}) "
+        f"SELECT DISTINCT ON (transaction_id) {columns} FROM transactions_static_load "
+        f"ON CONFLICT (transaction_id) DO NOTHING"
+    )).rowcount
+    connection.execute(text("TRUNCATE transactions_static_load"))
+    return inserted
+
+
+def load_static_transactions(engine: Engine, csv_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE, force: bool = False) -> dict:
+    """load csv_path into transactions_static, skipped once a load finished unless force"""
+    started = time.monotonic()
+    summary = {"inserted": 0, "duplicates": 0, "rejected": 0, "skipped": False}
+    is_postgres = engine.dialect.name == "postgresql"
+
+    with engine.connect() as connection:
+        if is_postgres:
+            # several workers may start at once, only one of them loads the file.
+            # a session lock, it has to outlive the per-chunk commits
+            connection.execute(text("SELECT pg_advisory_lock(hashtext('transactions_static'))"))
+            connection.commit()
+        try:
+            finished = connection.execute(
+                select(LOADS_TABLE.c.completed_at).where(LOADS_TABLE.c.table_name == STATIC_TABLE.name)
+            ).first()
+            if not force and finished:
+                print(f"🔁 Transactions already loaded at {finished.completed_at}. Skipping CSV import.")
+                summary["skipped"] = True
+                return summary
+            if connection.execute(text("SELECT 1 FROM transactions_static LIMIT 1")).first():
+                print(f"📥 Resuming the import of {csv_path}, loaded rows are skipped...")
+            else:
+                print(f"📥 Importing transactions from {csv_path}...")
+            connection.commit()
+
+            if is_postgres:
+                connection.execute(text(
+                    "CREATE TEMP TABLE IF NOT EXISTS transactions_static_load "
+                    "(LIKE transactions_static INCLUDING DEFAULTS)"
+                ))
+                connection.commit()
+
+            with open(csv_path, 'r', newline='') as f:
+                for valid, rejected in read_chunks(f, chunk_size):
+                    if valid:
+                        if is_postgres:
+                            inserted = copy_rows(connection, valid)
+                        else:
+                            inserted = connection.execute(
+                                upsert_insert(connection, STATIC_TABLE).on_conflict_do_nothing(), valid
+                            ).rowcount
+                        summary["inserted"] += inserted
+                        summary["duplicates"] += len(valid) - inserted
+                    if rejected:
+                        connection.execute(insert(ERRORS_TABLE), error_records(rejected, datetime.now()))
+                        summary["rejected"] += len(rejected)
+                    connection.commit()
+
+            connection.execute(delete(LOADS_TABLE).where(LOADS_TABLE.c.table_name == STATIC_TABLE.name))
+            connection.execute(insert(LOADS_TABLE).values(
+                table_name=STATIC_TABLE.name, csv_path=str(csv_path), completed_at=datetime.now()
+            ))
+            connection.commit()
+        finally:
+            connection.rollback()
+            if is_postgres:
+                connection.execute(text("DROP TABLE IF EXISTS transactions_static_load"))
+                connection.execute(text("SELECT pg_advisory_unlock(hashtext('transactions_static'))"))
+                connection.commit()
+
+    summary["seconds"] = round(time.monotonic() - started, 2)
+    print(
+        f"✅ Inserted {summary['inserted']} transactions "
+        f"({summary['rejected']} rejected, {summary['duplicates']} duplicates) in {summary['seconds']}s."
+    )
+    return summary
+
+
+if __name__ == "__main__":
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="bulk load the historical csv into transactions_static")
+    parser.add_argument("--csv", default=os.getenv("CSV_FILE_PATH"), help="path of the csv file")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="rows per COPY chunk")
+    parser.add_argument("--force", action="store_true", help="load again even if a load already finished")
+    args = parser.parse_args()
+
+    engine = create_engine(os.getenv("DATABASE_URL"))
+    SQLModel.metadata.create_all(engine)
+    load_static_transactions(engine, args.csv, chunk_size=args.chunk_size, force=args.force)
@@ -2,15 +2,10 @@
 from sqlmodel import SQLModel, Field
 from pydantic import field_validator
 from pydantic_core.core_schema import FieldValidationInfo
-from datetime import datetime
+from datetime import date, datetime
 from typing import Optional
-import uuid
-import hashlib
 from sqlalchemy import Index
-
-def generate_id():
-    raw_id = uuid.uuid4().hex
-    return hashlib.sha256(raw_id.encode()).hexdigest()[:12]
+from ids import generate_id
 
 # validate total_spent equal to quantity * unit_price
 class TransactionItemIn(SQLModel):
@@ -56,10 +51,18 @@ class TransactionIn(SQLModel):
             raise ValueError('Location must be either "In-store" or "Takeaway"')
         return v
 
+# result of a single transaction inside a batch request
+class TransactionBatchResult(SQLModel):
+    index: int
+    status: str  # created, error
+    transaction_id: str | None = None
+    total_spent: float | None = None
+    error: str | None = None
+
 # this is the static data downloaded from kaggle, will use this as old version of the data
 class Transaction_STATIC(SQLModel, table=True):
     __tablename__ = "transactions_static"
-    transaction_id: str = Field(default=generate_id(), primary_key=True, max_length=16)
+    transaction_id: str = Field(default_factory=generate_id, primary_key=True, max_length=16)
     item: str | None = Field(default=None, max_length=20)
     quantity: str | None = Field(default=None, max_length=10)
     price_per_unit: str | None = Field(default=None, max_length=10)
@@ -68,6 +71,13 @@ class Transaction_STATIC(SQLModel, table=True):
     location: str | None = Field(default=None, max_length=20)
     transaction_date: str | None = Field(default_factory=lambda: datetime.now().strftime("%Y-%m-%d"), max_length=10)
 
+# written by load_static_data.py after the last chunk, a load that stopped halfway has no row
+class StaticLoad(SQLModel, table=True):
+    __tablename__ = "static_loads"
+    table_name: str = Field(primary_key=True, max_length=64)
+    csv_path: str | None = Field(default=None)
+    completed_at: datetime = Field(default_factory=lambda: datetime.now())
+
 class Item(SQLModel, table=True):
     __tablename__ = "items"
     
@@ -114,8 +124,14 @@ class Transaction(SQLModel, table=True):
 
     __table_args__ = (
         Index('idx_customer_date', 'customer_id', 'created_at'),
+        Index('idx_transaction_created_at_id', 'created_at', 'transaction_id'),
     )
 
+# one page of transactions, next_cursor is None on the last page
+class TransactionPage(SQLModel):
+    items: list[Transaction]
+    next_cursor: str | None = None
+
 class TransactionItem(SQLModel, table=True):
     __tablename__ = "transaction_items"
     
@@ -142,7 +158,7 @@ class TransactionItem(SQLModel, table=True):
 class TransactionError(SQLModel, table=True):
     __tablename__ = "transactions_errors"
     id: int | None = Field(default=None, primary_key=True)
-    transaction_id: str | None = Field(default=generate_id(), max_length=16)
+    transaction_id: str | None = Field(default_factory=generate_id, max_length=16)
     item: str | None = Field(default=None)
     quantity: str | None = Field(default=None)
     price_per_unit: str | None = Field(default=None)
@@ -153,4 +169,16 @@ class TransactionError(SQLModel, table=True):
     error_message: str
     created_at: datetime = Field(default_factory=lambda: datetime.now())
 
+# maintained by create_transaction, so counts and revenue never need a scan of transactions
+class TransactionDailyStats(SQLModel, table=True):
+    __tablename__ = "transaction_stats_daily"
+    transaction_date: date = Field(primary_key=True)
+    transaction_count: int = Field(default=0)
+    total_revenue: float = Field(default=0)
+    updated_at: datetime = Field(default_factory=lambda: datetime.now())
 
+class TransactionSummary(SQLModel):
+    transaction_count: int
+    total_revenue: float
+    first_date: date | None = None
+    last_date: date | None = None
@@ -0,0 +1,20 @@
+# pagination.py
+# opaque keyset cursors over (created_at, transaction_id)
+from datetime import datetime
+import base64
+import json
+
+
+def encode_cursor(created_at: datetime, transaction_id: str) -> str:
+    raw = json.dumps([created_at.isoformat(), transaction_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, str]:
+    """raise ValueError if the cursor was not produced by encode_cursor"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, transaction_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(created_at), str(transaction_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
@@ -0,0 +1,180 @@
+# reference_cache.py
+# in-process cache of the reference data used on the transaction write path:
+# the latest price of every item name and the id of every payment method name.
+from sqlalchemy import func
+from sqlmodel import Session, select
+from models import Item, PaymentMethod
+from typing import Iterable, NamedTuple
+import threading
+import time
+
+
+class CachedItem(NamedTuple):
+    item_id: int
+    unit_price: float
+
+
+class ReferenceDataCache:
+    """Keeps items and payment methods in memory between requests.
+
+    Local writes call `invalidate()`. Writes made by other workers are picked up
+    through a version check (row count + latest timestamp of both tables) that
+    runs at most once every `ttl_seconds`; the tables are only reloaded when the
+    version actually changed. Names that are not in the database are remembered
+    too, until the next version change, so unknown names do not query on every
+    request. A snapshot read while `invalidate()` ran is discarded.
+    """
+
+    def __init__(self, ttl_seconds: float = 30):
+        self.ttl_seconds = ttl_seconds
+        self._items: dict[str, CachedItem] = {}
+        self._payment_methods: dict[str, int] = {}
+        # names looked up and not found, dropped with the snapshot
+        self._unknown_items: set[str] = set()
+        self._unknown_payment_methods: set[str] = set()
+        # bumped by invalidate(), reads started before it are not stored
+        self._generation = 0
+        self._version = None
+        self._checked_at = 0.0
+        # the lock only guards in-memory state, never a database round-trip
+        self._lock = threading.Lock()
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "negative_hits": 0,
+            "reloads": 0,
+            "version_checks": 0,
+            "invalidations": 0,
+            "db_reads": 0,
+        }
+
+    # --- public API ---
+    def get_items(self, session: Session, names: Iterable[str]) -> dict[str, CachedItem]:
+        """return the latest item for each known name, unknown names are left out"""
+        self._ensure_fresh(session)
+        names = set(names)
+        with self._lock:
+            found = {name: self._items[name] for name in names if name in self._items}
+            unknown = (names - found.keys()) & self._unknown_items
+            generation = self._generation
+        missing = names - found.keys() - unknown
+        self._count(hits=len(found), misses=len(missing), negative_hits=len(unknown))
+        if missing:
+            # may have been created by another worker since the last version check
+            loaded = self._load_items(session, missing)
+            with self._lock:
+                if generation == self._generation:
+                    self._items.update(loaded)
+                    self._unknown_items.update(missing - loaded.keys())
+            found.update(loaded)
+        return found
+
+    def get_item(self, session: Session, name: str) -> CachedItem | None:
+        return self.get_items(session, [name]).get(name)
+
+    def get_payment_method_ids(self, session: Session, names: Iterable[str]) -> dict[str, int]:
+        """return the id of each known payment method name, unknown names are left out"""
+        self._ensure_fresh(session)
+        names = set(names)
+        with self._lock:
+            found = {name: self._payment_methods[name] for name in names if name in self._payment_methods}
+            unknown = (names - found.keys()) & self._unknown_payment_methods
+            generation = self._generation
+        missing = names - found.keys() - unknown
+        self._count(hits=len(found), misses=len(missing), negative_hits=len(unknown))
+        if missing:
+            loaded = self._load_payment_methods(session, missing)
+            with self._lock:
+                if generation == self._generation:
+                    self._payment_methods.update(loaded)
+                    self._unknown_payment_methods.update(missing - loaded.keys())
+            found.update(loaded)
+        return found
+
+    def get_payment_method_id(self, session: Session, name: str) -> int | None:
+        return self.get_payment_method_ids(session, [name]).get(name)
+
+    def invalidate(self) -> None:
+        """drop everything, the next lookup reloads both tables"""
+        with self._lock:
+            self._items = {}
+            self._payment_methods = {}
+            self._unknown_items = set()
+            self._unknown_payment_methods = set()
+            self._generation += 1
+            self._version = None
+            self._checked_at = 0.0
+            self._counters["invalidations"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._counters,
+                "items": len(self._items),
+                "payment_methods": len(self._payment_methods),
+                "unknown_names": len(self._unknown_items) + len(self._unknown_payment_methods),
+                "ttl_seconds": self.ttl_seconds,
+                "seconds_since_check": round(time.monotonic() - self._checked_at, 3) if self._checked_at else None,
+            }
+
+    # --- internals ---
+    def _count(self, **increments: int) -> None:
+        with self._lock:
+            for name, value in increments.items():
+                self._counters[name] += value
+
+    def _ensure_fresh(self, session: Session) -> None:
+        with self._lock:
+            if self._version is not None and time.monotonic() - self._checked_at < self.ttl_seconds:
+                return
+            current_version = self._version
+            generation = self._generation
+
+        version = self._read_version(session)
+        if version == current_version:
+            with self._lock:
+                if generation == self._generation:
+                    self._checked_at = time.monotonic()
+            return
+
+        items = self._load_items(session)
+        payment_methods = self._load_payment_methods(session)
+        with self._lock:
+            if generation != self._generation:
+                # invalidated while loading, the snapshot may predate the write
+                return
+            self._items = items
+            self._unknown_items = set()
+            self._unknown_payment_methods = set()
+            self._payment_methods = payment_methods
+            self._version = version
+            self._checked_at = time.monotonic()
+            self._counters["reloads"] += 1
+
+    def _read_version(self, session: Session) -> tuple:
+        statement = select(
+            select(func.count(Item.item_id)).scalar_subquery(),
+            select(func.max(Item.updated_at)).scalar_subquery(),
+            select(func.count(PaymentMethod.payment_method_id)).scalar_subquery(),
+            select(func.max(PaymentMethod.created_at)).scalar_subquery(),
+        )
+        self._count(version_checks=1, db_reads=1)
+        return tuple(session.exec(statement).one())
+
+    def _load_items(self, session: Session, names: set[str] | None = None) -> dict[str, CachedItem]:
+        statement = select(Item.name, Item.item_id, Item.unit_price).order_by(Item.updated_at.desc())
+        if names is not None:
+            statement = statement.where(Item.name.in_(names))
+        self._count(db_reads=1)
+        items = {}
+        for name, item_id, unit_price in session.exec(statement):
+            # rows are newest first, keep only the latest price of each item
+            items.setdefault(name, CachedItem(item_id, unit_price))
+        return items
+
+    def _load_payment_methods(self, session: Session, names: set[str] | None = None) -> dict[str, int]:
+        statement = select(PaymentMethod.name, PaymentMethod.payment_method_id)
+        if names is not None:
+            statement = statement.where(PaymentMethod.name.in_(names))
+        self._count(db_reads=1)
+        return dict(session.exec(statement).all())
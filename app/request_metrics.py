@@ -0,0 +1,254 @@
+# request_metrics.py
+# per-route request instrumentation for the API: latency histograms, the number
+# of SQL statements and the database time of every request, and the time spent
+# waiting for a pooled connection. Exposed in the Prometheus text format on
+# GET /metrics. An opt-in sampling profiler writes the stacks of slow requests
+# to PROFILE_DIR.
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from typing import Iterable
+import collections
+import sys
+import threading
+import time
+
+# upper bounds of the histogram buckets, seconds for the durations
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+
+@dataclass
+class RequestStats:
+    """what one request did on the database, shared with the threads it runs on"""
+    statements: int = 0
+    db_seconds: float = 0.0
+    pool_wait_seconds: float = 0.0
+    # threads that ran database work for the request, sampled by the profiler
+    thread_ids: set = field(default_factory=set)
+
+
+_current: ContextVar[RequestStats | None] = ContextVar("request_stats", default=None)
+
+
+def record_pool_wait(seconds: float):
+    """called by database.py once a session got its connection from the pool"""
+    stats = _current.get()
+    if stats is not None:
+        stats.pool_wait_seconds += seconds
+        stats.thread_ids.add(threading.get_ident())
+
+
+class Histogram:
+    """cumulative Prometheus histogram, one series per label tuple"""
+
+    def __init__(self, name: str, help_text: str, label_names: tuple, buckets: Iterable[float]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        self._series: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple, value: float):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # bucket counts, then sum and count
+                series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for labels, values in sorted(series.items()):
+            label_text = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, labels))
+            prefix = f"{label_text}," if label_text else ""
+            for bound, count in zip(self.buckets, values):
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {values[-1]}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {values[-2]}")
+            lines.append(f"{self.name}_count{{{label_text}}} {values[-1]}")
+        return lines
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class SamplingProfiler:
+    """Samples the stacks of the threads serving one request every `interval` seconds.
+
+    Python has no per-request stacks, so the event loop thread and the threadpool
+    threads that ran the request's database work are sampled. Other requests running
+    at the same time on those threads show up too, profile one request at a time.
+    The result is written in the collapsed stack format (flamegraph.pl, speedscope).
+    """
+
+    def __init__(self, thread_ids: set, interval: float = 0.005):
+        self.thread_ids = thread_ids
+        self.interval = interval
+        self.samples: collections.Counter = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id in list(self.thread_ids):
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    stack.append(f"{frame.f_code.co_name} ({Path(frame.f_code.co_filename).name}:{frame.f_lineno})")
+                    frame = frame.f_back
+                if stack:
+                    self.samples[";".join(reversed(stack))] += 1
+
+    def write(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("".join(f"{stack} {count}\n" for stack, count in self.samples.most_common()))
+
+
+class RequestMetrics:
+    """Collects the metrics of every request and renders them for /metrics.
+
+    `instrument(engine)` hooks the SQLAlchemy events that count statements and time
+    them, RequestMetricsMiddleware times the requests and records them here.
+    """
+
+    def __init__(self, profile_dir: str | None = None, profile_slow_seconds: float = 1.0, profile_header: str = "x-profile"):
+        self.profile_dir = Path(profile_dir) if profile_dir else None
+        self.profile_slow_seconds = profile_slow_seconds
+        self.profile_header = profile_header.lower().encode()
+        self.request_seconds = Histogram(
+            "http_request_duration_seconds", "Request latency, until the last byte is sent",
+            ("method", "route", "status"), LATENCY_BUCKETS
+        )
+        self.db_statements = Histogram(
+            "http_request_db_statements", "SQL statements executed per request",
+            ("method", "route"), STATEMENT_BUCKETS
+        )
+        self.db_seconds = Histogram(
+            "http_request_db_seconds", "Time spent executing SQL statements per request",
+            ("method", "route"), LATENCY_BUCKETS
+        )
+        self.pool_wait_seconds = Histogram(
+            "http_request_pool_wait_seconds", "Time spent waiting for a pooled connection per request",
+            ("method", "route"), LATENCY_BUCKETS
+        )
+        self.profiles_written = 0
+
+    # --- database hooks ---
+    def instrument(self, engine: Engine):
+        """count and time every statement executed on engine (use async_engine.sync_engine for async)"""
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - conn.info["query_started"].pop()
+            stats = _current.get()
+            if stats is not None:
+                stats.statements += 1
+                stats.db_seconds += elapsed
+
+        @event.listens_for(engine, "handle_error")
+        def handle_error(exception_context):
+            # a failed statement never reaches after_cursor_execute
+            conn = exception_context.connection
+            if conn is not None and conn.info.get("query_started"):
+                conn.info["query_started"].pop()
+
+    def record(self, scope, status: int, elapsed: float, stats: RequestStats):
+        route = scope.get("route")
+        # unmatched paths share one label, the raw path would blow up the series count
+        route_label = getattr(route, "path", "unmatched")
+        method = scope["method"]
+        self.request_seconds.observe((method, route_label, str(status)), elapsed)
+        self.db_statements.observe((method, route_label), stats.statements)
+        self.db_seconds.observe((method, route_label), stats.db_seconds)
+        self.pool_wait_seconds.observe((method, route_label), stats.pool_wait_seconds)
+
+    # --- profiler ---
+    def start_profiler(self, scope, stats: RequestStats) -> SamplingProfiler | None:
+        if self.profile_dir is None:
+            return None
+        if not any(name == self.profile_header for name, _ in scope.get("headers", [])):
+            return None
+        profiler = SamplingProfiler(stats.thread_ids)
+        profiler.start()
+        return profiler
+
+    def finish_profiler(self, profiler: SamplingProfiler, scope, elapsed: float):
+        profiler.stop()
+        if elapsed < self.profile_slow_seconds:
+            return
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{scope['method']}{scope['path'].replace('/', '_')}-{elapsed * 1000:.0f}ms.folded"
+        profiler.write(self.profile_dir / name)
+        self.profiles_written += 1
+        print(f"🐢 {scope['method']} {scope['path']} took {elapsed:.3f}s, profile written to {self.profile_dir / name}")
+
+    # --- exposition ---
+    def render(self) -> str:
+        lines = []
+        for histogram in (self.request_seconds, self.db_statements, self.db_seconds, self.pool_wait_seconds):
+            lines.extend(histogram.render())
+        lines.append("# HELP http_request_profiles_written_total Slow request profiles written to PROFILE_DIR")
+        lines.append("# TYPE http_request_profiles_written_total counter")
+        lines.append(f"http_request_profiles_written_total {self.profiles_written}")
+        return "\n".join(lines) + "\n"
+
+
+class RequestMetricsMiddleware:
+    """ASGI middleware feeding RequestMetrics.
+
+    Each request is timed from the call to the last byte sent, so streamed responses
+    are measured in full, and labelled with the route template, never the raw path.
+    The RequestStats set here are seen by the threadpool and the engine events,
+    contextvars are copied into both.
+    """
+
+    def __init__(self, app, metrics: RequestMetrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats(thread_ids={threading.get_ident()})
+        token = _current.set(stats)
+        profiler = self.metrics.start_profiler(scope, stats)
+        status = 500
+        started = time.perf_counter()
+
+        async def send_and_record(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_record)
+        finally:
+            elapsed = time.perf_counter() - started
+            _current.reset(token)
+            self.metrics.record(scope, status, elapsed, stats)
+            if profiler is not None:
+                self.metrics.finish_profiler(profiler, scope, elapsed)
@@ -0,0 +1,109 @@
+# transaction_stats.py
+# per-day transaction counts and revenue, kept up to date in the same database
+# transaction that writes the transactions. reads never touch the transactions
+# table, they only scan one row per day.
+from sqlalchemy import func, delete, insert, text
+from sqlmodel import Session, select
+from database import upsert_insert
+from models import Transaction, TransactionDailyStats, TransactionSummary
+from datetime import date, datetime
+from typing import Iterable
+
+
+def record_transactions(session: Session, transactions: Iterable[tuple[datetime, float]]) -> None:
+    """add (created_at, total_spent) pairs to the daily stats, caller commits"""
+    days: dict[date, list] = {}
+    for created_at, total_spent in transactions:
+        day = days.setdefault(created_at.date(), [0, 0.0])
+        day[0] += 1
+        day[1] += total_spent
+    if not days:
+        return
+
+    now = datetime.now()
+    statement = upsert_insert(session, TransactionDailyStats).values([
+        {"transaction_date": day, "transaction_count": count, "total_revenue": revenue, "updated_at": now}
+        # sorted so concurrent writers lock the day rows in the same order
+        for day, (count, revenue) in sorted(days.items())
+    ])
+    statement = statement.on_conflict_do_update(
+        index_elements=[TransactionDailyStats.transaction_date],
+        set_={
+            "transaction_count": TransactionDailyStats.transaction_count + statement.excluded.transaction_count,
+            "total_revenue": TransactionDailyStats.total_revenue + statement.excluded.total_revenue,
+            "updated_at": statement.excluded.updated_at,
+        }
+    )
+    session.exec(statement)
+
+
+def read_summary(session: Session) -> TransactionSummary:
+    transaction_count, total_revenue, first_date, last_date = session.exec(
+        select(
+            func.coalesce(func.sum(TransactionDailyStats.transaction_count), 0),
+            func.coalesce(func.sum(TransactionDailyStats.total_revenue), 0.0),
+            func.min(TransactionDailyStats.transaction_date),
+            func.max(TransactionDailyStats.transaction_date),
+        )
+    ).one()
+    return TransactionSummary(
+        transaction_count=transaction_count,
+        total_revenue=total_revenue,
+        first_date=first_date,
+        last_date=last_date
+    )
+
+
+def read_daily(session: Session, start: date | None = None, end: date | None = None) -> list[TransactionDailyStats]:
+    statement = select(TransactionDailyStats).order_by(TransactionDailyStats.transaction_date)
+    if start is not None:
+        statement = statement.where(TransactionDailyStats.transaction_date >= start)
+    if end is not None:
+        statement = statement.where(TransactionDailyStats.transaction_date <= end)
+    return session.exec(statement).all()
+
+
+def count_exact(session: Session) -> int:
+    """full count of the transactions table, for audits"""
+    return session.exec(select(func.count()).select_from(Transaction)).one()
+
+
+def lock_transaction_stats(session: Session) -> None:
+    """serialize rebuilds across workers until the transaction ends (PostgreSQL only)"""
+    if session.get_bind().dialect.name == "postgresql":
+        session.exec(text("SELECT pg_advisory_xact_lock(hashtext('transaction_stats_daily'))"))
+
+
+def rebuild_transaction_stats(session: Session) -> TransactionSummary:
+    """recompute the daily stats from the transactions table"""
+    lock_transaction_stats(session)
+    transaction_date = func.date(Transaction.created_at)
+    session.exec(delete(TransactionDailyStats))
+    session.exec(
+        insert(TransactionDailyStats).from_select(
+            ["transaction_date", "transaction_count", "total_revenue", "updated_at"],
+            select(
+                transaction_date,
+                func.count(),
+                func.sum(Transaction.total_spent),
+                func.now(),
+            ).group_by(transaction_date)
+        )
+    )
+    session.commit()
+    return read_summary(session)
+
+
+def rebuild_transaction_stats_if_empty(session: Session) -> None:
+    """backfill the stats the first time the app starts on an existing database"""
+    # workers starting together wait here, the first one rebuilds and the others
+    # see its rows once they get the lock
+    lock_transaction_stats(session)
+    if session.exec(select(TransactionDailyStats.transaction_date).limit(1)).first() is not None:
+        session.commit()
+        return
+    if session.exec(select(Transaction.transaction_id).limit(1)).first() is None:
+        session.commit()
+        return
+    summary = rebuild_transaction_stats(session)
+    print(f"📊 Rebuilt transaction stats for {summary.transaction_count} transactions.")
@@ -22,7 +22,9 @@ def truncate_all_tables():
         "transaction_items",
         "transactions",
         "transactions_static",
+        "static_loads",
         "transactions_errors",
+        "transaction_stats_daily",
         "customers",
         "items",
         "payment_methods"
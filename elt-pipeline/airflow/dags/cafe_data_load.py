@@ -1,7 +1,9 @@
 from datetime import datetime, timedelta
 from airflow import DAG
-from airflow.operators.python import PythonOperator
 from airflow.operators.dummy import DummyOperator
+from airflow.decorators import task, task_group
+from airflow.exceptions import AirflowSkipException
+from airflow.utils.trigger_rule import TriggerRule
 import sys
 import os
 
@@ -11,6 +13,18 @@ sys.path.append('/opt/airflow/scripts')
 from cafe_postgres2gcs import load_select_tables_from_database
 from cafe_gcs2bq import read_parquet_chunked
 from cafe_transformation_dbt import run_dbt_transformations
+from cafe_tables import CAFE_TABLES
+from cafe_metrics import METRICS_XCOM_KEY, record_pipeline_metrics
+
+# Every table is extracted, loaded and staged in its own mapped task, so a slow table does not hold
+# up the others and a retry only reruns the failed table. Postgres reads share the `cafe_extract`
+# pool and warehouse writes the `cafe_warehouse` pool, both are created by airflow-init with
+# CAFE_EXTRACT_POOL_SLOTS / CAFE_WAREHOUSE_POOL_SLOTS slots
+EXTRACT_POOL = 'cafe_extract'
+WAREHOUSE_POOL = 'cafe_warehouse'
+# how many tables one run works on at the same time, per step
+MAX_PARALLEL_TABLES = int(os.getenv('CAFE_MAX_PARALLEL_TABLES', '6'))
+
 default_args = {
     'owner': 'airflow',
     'depends_on_past': False,
@@ -27,33 +41,80 @@ with DAG(
     schedule_interval='@hourly',
     start_date=datetime(2024, 1, 1),
     catchup=False,
+    # runs of the same table share the dlt cursor state, never let two runs overlap
+    max_active_runs=1,
     tags=['cafe', 'data-pipeline'],
     params={
-        'write_disposition': "append"
+        'write_disposition': "append",
+        # drop the extract cursors and re-export every table (backfills)
+        'full_refresh': False
     }
 ) as dag:
 
     # start the pipeline
     start_pipeline = DummyOperator(task_id='start_pipeline')
 
-    # Define the task to run the pipeline
-    postgres_to_gcs = PythonOperator(
-        task_id='postgres_to_gcs',
-        python_callable=load_select_tables_from_database
-    )
+    @task(pool=EXTRACT_POOL, max_active_tis_per_dagrun=MAX_PARALLEL_TABLES)
+    def postgres_to_gcs(table_name, **context):
+        load_select_tables_from_database(table_name, **context)
+
+    # returns the rows loaded into the table
+    @task(pool=WAREHOUSE_POOL, max_active_tis_per_dagrun=MAX_PARALLEL_TABLES)
+    def gcs_to_bq(table_name, **context):
+        return read_parquet_chunked(table_name, **context)
+
+    # the staging model of a table starts as soon as that table has landed, if it got new rows
+    @task(pool=WAREHOUSE_POOL, max_active_tis_per_dagrun=MAX_PARALLEL_TABLES)
+    def run_dbt_staging(table_name, loaded_rows, **context):
+        staging_model = CAFE_TABLES[table_name]['staging_model']
+        if staging_model is None:
+            raise AirflowSkipException(f'{table_name} has no hourly staging model')
+        if not loaded_rows.get(table_name):
+            raise AirflowSkipException(f'no new rows in {table_name}')
+        run_dbt_transformations(select=[staging_model], run_name=staging_model, **context)
+
+    @task_group
+    def load_table(table_name):
+        loaded_rows = gcs_to_bq(table_name)
+        postgres_to_gcs(table_name) >> loaded_rows
+        run_dbt_staging(table_name, loaded_rows)
+
+    # only the marts downstream of tables that received rows are built, none on a quiet hour.
+    # a skipped staging step does not block them
+    @task(pool=WAREHOUSE_POOL, trigger_rule=TriggerRule.NONE_FAILED)
+    def run_dbt_marts(**context):
+        loaded_rows = {}
+        for table_rows in context['ti'].xcom_pull(task_ids='load_table.gcs_to_bq') or []:
+            loaded_rows.update(table_rows)
+        print(f'loaded rows: {loaded_rows}')
+        changed_models = [
+            CAFE_TABLES[table_name]['staging_model'] for table_name, rows in loaded_rows.items()
+            if rows and CAFE_TABLES[table_name]['staging_model']
+        ]
+        if not changed_models:
+            raise AirflowSkipException('no new rows in any table')
+        run_dbt_transformations(
+            select=[f'{model}+,path:models/cafe/marts' for model in changed_models],
+            run_name='marts',
+            **context
+        )
 
-    gcs_to_bq = PythonOperator(
-        task_id='gcs_to_bq',
-        python_callable=read_parquet_chunked
-    )
+    # rows, bytes and seconds per table and step, and the dbt model runtimes, appended to the
+    # warehouse for trend charts. Runs whatever happened upstream, so failed runs are recorded too
+    @task(pool=WAREHOUSE_POOL, trigger_rule=TriggerRule.ALL_DONE)
+    def record_metrics(**context):
+        pushed = context['ti'].xcom_pull(
+            task_ids=['load_table.postgres_to_gcs', 'load_table.gcs_to_bq', 'load_table.run_dbt_staging', 'run_dbt_marts'],
+            key=METRICS_XCOM_KEY
+        )
+        return record_pipeline_metrics(context['run_id'], [metrics for metrics in pushed or [] if metrics])
 
-    run_dbt_transformations = PythonOperator(
-        task_id='run_dbt_transformations',
-        python_callable=run_dbt_transformations
-    )
+    load_tables = load_table.expand(table_name=list(CAFE_TABLES))
+    dbt_marts = run_dbt_marts()
+    pipeline_metrics = record_metrics()
 
     # end the pipeline
     end_pipeline = DummyOperator(task_id='end_pipeline')
     
-# set the order of the tasks
-start_pipeline >> postgres_to_gcs >> gcs_to_bq >> run_dbt_transformations >> end_pipeline
+# set the order of the tasks. record_metrics is a leaf of its own, its success does not hide a failed run
+start_pipeline >> load_tables >> dbt_marts >> [pipeline_metrics, end_pipeline]
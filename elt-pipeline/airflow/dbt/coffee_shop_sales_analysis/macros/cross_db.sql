@@ -0,0 +1,9 @@
+{# helpers for the SQL that differs between BigQuery and the local DuckDB backend #}
+
+{% macro type_double() %}
+    {{ return(adapter.dispatch('type_double')()) }}
+{% endmacro %}
+
+{% macro bigquery__type_double() %}float64{% endmacro %}
+
+{% macro default__type_double() %}double{% endmacro %}
@@ -0,0 +1,18 @@
+{# newest `column` already in this model, moved back `lookback_hours`, 1900-01-01 if the
+   model has no such rows yet #}
+{% macro incremental_watermark(column, where=none, lookback_hours=0) %}
+coalesce(
+    (
+        select cast({{ dbt.dateadd('hour', -lookback_hours, 'max(' ~ column ~ ')') }} as {{ dbt.type_timestamp() }})
+        from {{ this }}
+        {% if where %}where {{ where }}{% endif %}
+    ),
+    cast('1900-01-01' as {{ dbt.type_timestamp() }})
+)
+{% endmacro %}
+
+{# filter for incremental runs: rows from incremental_lookback_hours before the newest
+   `column` already in this model, everything if the model has no such rows yet #}
+{% macro incremental_lookback(column, where=none) %}
+{{ column }} >= {{ incremental_watermark(column, where, var('incremental_lookback_hours')) }}
+{% endmacro %}
@@ -0,0 +1,34 @@
+{# daily quantity sold per item, read by the dashboard instead of joining dim_transaction_items to dim_items #}
+{{
+    config(
+        materialized='incremental',
+        incremental_strategy=('merge' if target.type == 'bigquery' else 'delete+insert'),
+        unique_key=['transaction_date', 'item_name'],
+        partition_by={
+            'field': 'transaction_date',
+            'data_type': 'date'
+        },
+        on_schema_change='fail'
+    )
+}}
+with transaction_items as (
+    select
+        item_id,
+        quantity,
+        cast(created_at as date) as transaction_date
+    from {{ ref('dim_transaction_items') }}
+    {% if is_incremental() %}
+    -- recompute the last loaded day and everything after it
+    where cast(created_at as date) >= (select max(transaction_date) from {{ this }})
+    {% endif %}
+),
+items as (
+    select * from {{ ref('dim_items') }}
+)
+select
+    transaction_items.transaction_date,
+    coalesce(items.name, 'Unknown') as item_name,
+    sum(transaction_items.quantity) as total_quantity
+from transaction_items
+left join items on transaction_items.item_id = items.item_id
+group by 1, 2
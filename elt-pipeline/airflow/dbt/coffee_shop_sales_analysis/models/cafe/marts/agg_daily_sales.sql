@@ -0,0 +1,28 @@
+{# daily orders and sales per location and payment method, read by the dashboard instead of fct_transactions #}
+{{
+    config(
+        materialized='incremental',
+        incremental_strategy=('merge' if target.type == 'bigquery' else 'delete+insert'),
+        unique_key=['transaction_date', 'location', 'payment_method_name'],
+        partition_by={
+            'field': 'transaction_date',
+            'data_type': 'date'
+        },
+        on_schema_change='fail'
+    )
+}}
+with transactions as (
+    select * from {{ ref('fct_transactions') }}
+    {% if is_incremental() %}
+    -- recompute the last loaded day and everything after it
+    where transaction_date >= (select max(transaction_date) from {{ this }})
+    {% endif %}
+)
+select
+    transaction_date,
+    coalesce(location, 'Unknown') as location,
+    coalesce(payment_method_name, 'Unknown') as payment_method_name,
+    count(distinct transaction_id) as order_count,
+    sum(cast(total_spent as {{ dbt.type_numeric() }})) as total_sales
+from transactions
+group by 1, 2, 3
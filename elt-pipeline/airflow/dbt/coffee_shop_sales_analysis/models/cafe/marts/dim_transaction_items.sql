@@ -1,12 +1,41 @@
+{# config incremental strategy, only new transaction items are joined and merged on each run #}
+{# the merge only scans the partitions the new rows can match: the api lookback window, and the
+   days after the static watermark. delete+insert has no DBT_INTERNAL_DEST alias, DuckDB scans anyway #}
+{% set merge_window -%}
+    DBT_INTERNAL_DEST.created_at >= least(
+        {{ incremental_watermark('created_at', where="record_source = 'api'", lookback_hours=var('incremental_lookback_hours')) }},
+        {{ incremental_watermark('created_at', where="record_source = 'static'") }}
+    )
+{%- endset %}
+{{
+    config(
+        materialized='incremental',
+        incremental_strategy=('merge' if target.type == 'bigquery' else 'delete+insert'),
+        unique_key=['transaction_id', 'item_id'],
+        incremental_predicates=([merge_window] if target.type == 'bigquery' else none),
+        partition_by={
+            'field': 'created_at',
+            'data_type': 'timestamp',
+            'granularity': 'day'
+        },
+        cluster_by=['item_id'],
+        on_schema_change='fail'
+    )
+}}
 with transaction_items as (
-    select 
+    select
         transaction_id,
         item_id,
         quantity,
         unit_price,
         subtotal,
-        created_at
+        created_at,
+        'api' as record_source
     from {{ ref('stg_transaction_items') }}
+    {% if is_incremental() %}
+    -- look back a little for items committed out of order, the merge drops the duplicates
+    where {{ incremental_lookback('created_at', where="record_source = 'api'") }}
+    {% endif %}
 ),
 transaction_items_static_with_item_id as (
     select
@@ -15,11 +44,23 @@ transaction_items_static_with_item_id as (
         tx_s.quantity,
         tx_s.unit_price,
         tx_s.total_spent,
-        timestamp(tx_s.transaction_date) as created_at
+        cast(tx_s.transaction_date as {{ dbt.type_timestamp() }}) as created_at,
+        'static' as record_source
     from {{ ref('stg_transactions_static') }} tx_s
-    left join {{ ref('stg_items') }} i 
-    on 
+    left join {{ ref('stg_items') }} i
+    on
     tx_s.item_name = i.name
+    {% if is_incremental() %}
+    -- the history is resolved once, later runs only pick up days added to the static seed
+    where tx_s.transaction_date > coalesce(
+        (
+            select cast(max(created_at) as date)
+            from {{ this }}
+            where record_source = 'static'
+        ),
+        cast('1900-01-01' as date)
+    )
+    {% endif %}
 )
 select
   *
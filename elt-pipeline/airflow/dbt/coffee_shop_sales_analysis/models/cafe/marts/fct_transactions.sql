@@ -1,8 +1,8 @@
-# config incremental strategy
+{# config incremental strategy, DuckDB merges with delete+insert #}
 {{
     config(
         materialized='incremental',
-        incremental_strategy='merge',
+        incremental_strategy=('merge' if target.type == 'bigquery' else 'delete+insert'),
         unique_key='transaction_id',
         partition_by={
             'field': 'transaction_date',
@@ -14,7 +14,7 @@
 with transactions as (
     select * from {{ ref('stg_transactions') }}
     {% if is_incremental() %}
-    where date(created_at) >= (select max(transaction_date) from {{ this }})
+    where cast(created_at as date) >= (select max(transaction_date) from {{ this }})
     {% endif %}
 ),
 transactions_static as (
@@ -33,7 +33,7 @@ transactions_join_payment_methods as (
         transactions.location,
         transactions.created_at,
         transactions.updated_at,
-        date(transactions.created_at) as transaction_date,
+        cast(transactions.created_at as date) as transaction_date,
         payment_methods.name as payment_method_name
     from transactions
     left join payment_methods on transactions.payment_method_id = payment_methods.payment_method_id
@@ -1,11 +1,28 @@
+{{ config(unique_key='customer_id') }}
+
 with source_customers as (
-select 
+select
     customer_id,
     name,
     email,
     created_at,
     updated_at
-    from {{ source('coffee_shop_analysis', 'customers') }}
+from {{ source('coffee_shop_analysis', 'customers') }}
+{% if is_incremental() %}
+where {{ incremental_lookback('updated_at') }}
+{% endif %}
+),
+ranked_customers as (
+select
+    *,
+    row_number() over (partition by customer_id order by updated_at desc) as row_num
+from source_customers
 )
-select distinct * from source_customers
-
+select
+    customer_id,
+    name,
+    email,
+    created_at,
+    updated_at
+from ranked_customers
+where row_num = 1
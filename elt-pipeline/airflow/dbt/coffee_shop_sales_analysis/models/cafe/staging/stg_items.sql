@@ -1,11 +1,30 @@
+{{ config(unique_key='item_id') }}
+
 with source_items as (
-select 
-    item_id, 
-    name, 
-    description, 
-    unit_price, 
-    created_at, 
-    updated_at 
+select
+    item_id,
+    name,
+    description,
+    unit_price,
+    created_at,
+    updated_at
 from {{ source('coffee_shop_analysis', 'items') }}
+{% if is_incremental() %}
+where {{ incremental_lookback('updated_at') }}
+{% endif %}
+),
+ranked_items as (
+select
+    *,
+    row_number() over (partition by item_id order by updated_at desc) as row_num
+from source_items
 )
-select distinct * from source_items
+select
+    item_id,
+    name,
+    description,
+    unit_price,
+    created_at,
+    updated_at
+from ranked_items
+where row_num = 1
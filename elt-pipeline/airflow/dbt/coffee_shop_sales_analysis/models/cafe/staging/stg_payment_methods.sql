@@ -1,9 +1,26 @@
+{{ config(unique_key='payment_method_id') }}
+
 with source_payment_methods as (
-select 
+select
     payment_method_id,
     name,
     is_active,
     created_at
 from {{ source('coffee_shop_analysis', 'payment_methods') }}
+{% if is_incremental() %}
+where {{ incremental_lookback('created_at') }}
+{% endif %}
+),
+ranked_payment_methods as (
+select
+    *,
+    row_number() over (partition by payment_method_id order by created_at desc) as row_num
+from source_payment_methods
 )
-select distinct * from source_payment_methods
\ No newline at end of file
+select
+    payment_method_id,
+    name,
+    is_active,
+    created_at
+from ranked_payment_methods
+where row_num = 1
@@ -1,5 +1,7 @@
+{{ config(unique_key=['transaction_id', 'item_id']) }}
+
 with source_transaction_items as (
-select 
+select
     transaction_id,
     item_id,
     quantity,
@@ -7,5 +9,22 @@ select
     subtotal,
     created_at
 from {{ source('coffee_shop_analysis', 'transaction_items') }}
+{% if is_incremental() %}
+where {{ incremental_lookback('created_at') }}
+{% endif %}
+),
+ranked_transaction_items as (
+select
+    *,
+    row_number() over (partition by transaction_id, item_id order by created_at desc) as row_num
+from source_transaction_items
 )
-select distinct * from source_transaction_items
\ No newline at end of file
+select
+    transaction_id,
+    item_id,
+    quantity,
+    unit_price,
+    subtotal,
+    created_at
+from ranked_transaction_items
+where row_num = 1
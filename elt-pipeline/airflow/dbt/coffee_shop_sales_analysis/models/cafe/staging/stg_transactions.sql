@@ -1,5 +1,7 @@
+{{ config(unique_key='transaction_id') }}
+
 with source_transactions as (
-select 
+select
     transaction_id,
     customer_id,
     payment_method_id,
@@ -9,5 +11,24 @@ select
     created_at,
     updated_at
 from {{ source('coffee_shop_analysis', 'transactions') }}
+{% if is_incremental() %}
+where {{ incremental_lookback('updated_at') }}
+{% endif %}
+),
+ranked_transactions as (
+select
+    *,
+    row_number() over (partition by transaction_id order by updated_at desc) as row_num
+from source_transactions
 )
-select distinct * from source_transactions
+select
+    transaction_id,
+    customer_id,
+    payment_method_id,
+    total_spent,
+    location,
+    status,
+    created_at,
+    updated_at
+from ranked_transactions
+where row_num = 1
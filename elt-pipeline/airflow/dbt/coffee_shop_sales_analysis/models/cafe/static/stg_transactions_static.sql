@@ -2,47 +2,65 @@
     config(
         materialized='incremental',
         unique_key='transaction_id',
-        incremental_strategy='merge'
+        incremental_strategy=('merge' if target.type == 'bigquery' else 'delete+insert')
     )
 }}
 
+{% if var('static_source') == 'backfill' %}
+
+{# cafe_backfill_static.py already rejected the ERROR/UNKNOWN rows and typed the columns #}
+with source_transactions_static as (
+    select
+        transaction_id,
+        item_name,
+        quantity,
+        unit_price,
+        total_spent,
+        location,
+        payment_method,
+        transaction_date
+    from {{ source('coffee_shop_analysis', 'transactions_static_backfill') }}
+    {% if is_incremental() %}
+    where transaction_date > (select max(transaction_date) from {{ this }})
+    {% endif %}
+)
+
+{% else %}
+
+{# the seed keeps the CSV headers and the dirty values, quote the headers for the current adapter #}
+{% set headers = [
+    'Transaction ID', 'Item', 'Quantity', 'Price Per Unit',
+    'Total Spent', 'Location', 'Payment Method', 'Transaction Date'
+] %}
+{% set transaction_id_col = adapter.quote('Transaction ID') %}
+{% set item_col = adapter.quote('Item') %}
+{% set quantity_col = adapter.quote('Quantity') %}
+{% set price_col = adapter.quote('Price Per Unit') %}
+{% set total_col = adapter.quote('Total Spent') %}
+{% set location_col = adapter.quote('Location') %}
+{% set payment_col = adapter.quote('Payment Method') %}
+{% set date_col = adapter.quote('Transaction Date') %}
+
 with source_transactions_static as (
     select 
-        `Transaction ID` as transaction_id,
-        `Item` as item_name,
-        cast(`Quantity` as int64) as quantity,
-        cast(`Price Per Unit` as float64) as unit_price,
-        cast(`Total Spent` as float64) as total_spent,
-        `Location` as location,
-        `Payment Method` as payment_method,
-        date(`Transaction Date`) as transaction_date
+        {{ transaction_id_col }} as transaction_id,
+        {{ item_col }} as item_name,
+        cast({{ quantity_col }} as {{ dbt.type_int() }}) as quantity,
+        cast({{ price_col }} as {{ type_double() }}) as unit_price,
+        cast({{ total_col }} as {{ type_double() }}) as total_spent,
+        {{ location_col }} as location,
+        {{ payment_col }} as payment_method,
+        cast({{ date_col }} as date) as transaction_date
     from {{ ref('cafe_sales_static') }}
-    where `Transaction ID` is not null
-    and `Transaction ID` != 'ERROR'
-    and `Transaction ID` != 'UNKNOWN'
-    and `Item` is not null
-    and `Item` != 'ERROR'
-    and `Item` != 'UNKNOWN'
-    and `Quantity` is not null
-    and `Quantity` != 'ERROR'
-    and `Quantity` != 'UNKNOWN'
-    and `Price Per Unit` is not null
-    and `Price Per Unit` != 'ERROR'
-    and `Price Per Unit` != 'UNKNOWN'
-    and `Total Spent` is not null
-    and `Total Spent` != 'ERROR'
-    and `Total Spent` != 'UNKNOWN'
-    and `Location` is not null
-    and `Location` != 'ERROR'
-    and `Location` != 'UNKNOWN'
-    and `Payment Method` is not null
-    and `Payment Method` != 'ERROR'
-    and `Payment Method` != 'UNKNOWN'
-    and `Transaction Date` is not null
-    and `Transaction Date` != 'ERROR'
-    and `Transaction Date` != 'UNKNOWN'
+    where true
+    {% for header in headers %}
+    and {{ adapter.quote(header) }} is not null
+    and {{ adapter.quote(header) }} not in ('ERROR', 'UNKNOWN')
+    {% endfor %}
     {% if is_incremental() %}
-    and date(`Transaction Date`) > (select max(transaction_date) from {{ this }})
+    and cast({{ date_col }} as date) > (select max(transaction_date) from {{ this }})
     {% endif %}
 )
+
+{% endif %}
 select distinct * from source_transactions_static
\ No newline at end of file
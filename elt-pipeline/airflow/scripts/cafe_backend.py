@@ -0,0 +1,35 @@
+# flake8: noqa
+# Where the pipeline writes to. `bigquery` (default) uses the GCS bucket and BigQuery datasets
+# from .dlt, `duckdb` keeps everything on local disk: the lake under LAKE_BUCKET_URL and the
+# warehouse in the DuckDB file at DUCKDB_PATH, so the whole DAG runs offline.
+import os
+
+import dlt
+
+CAFE_BACKEND = os.getenv("CAFE_BACKEND", "bigquery")
+if CAFE_BACKEND not in ("bigquery", "duckdb"):
+    raise ValueError(f"CAFE_BACKEND must be 'bigquery' or 'duckdb', got {CAFE_BACKEND!r}")
+
+LAKE_BUCKET_URL = os.getenv("LAKE_BUCKET_URL", "file:///opt/airflow/data/lake")
+DUCKDB_PATH = os.getenv("DUCKDB_PATH", "/opt/airflow/data/coffee_shop.duckdb")
+
+
+def lake_destination():
+    """filesystem destination of the extract step"""
+    if CAFE_BACKEND == "duckdb":
+        return dlt.destinations.filesystem(bucket_url=LAKE_BUCKET_URL)
+    return "filesystem"
+
+
+def lake_bucket_url() -> str:
+    """bucket the load step reads the lake from"""
+    if CAFE_BACKEND == "duckdb":
+        return LAKE_BUCKET_URL
+    return dlt.config["sources.filesystem.bucket_url"]
+
+
+def warehouse_destination():
+    """destination of the load and transformation steps"""
+    if CAFE_BACKEND == "duckdb":
+        return dlt.destinations.duckdb(DUCKDB_PATH)
+    return "bigquery"
@@ -0,0 +1,179 @@
+# flake8: noqa
+import argparse
+from typing import Dict, Iterator, Tuple
+
+import dlt
+import fsspec
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+import pyarrow.dataset as ds
+from dlt.common import pendulum
+from dlt.sources.filesystem import filesystem
+from dlt.sources.filesystem.helpers import fsspec_from_resource
+from pyarrow.fs import FSSpecHandler, PyFileSystem
+
+from cafe_backend import lake_bucket_url, warehouse_destination
+
+# the historical Kaggle export, the same file the `cafe_sales_static` seed was built from
+DEFAULT_CSV = "/opt/airflow/dbt/coffee_shop_sales_analysis/seeds/cafe_old/cafe_sales_static.csv"
+# lake prefix of the backfill, apart from the `date=` load partitions cafe_gcs2bq.py reads
+BACKFILL_DIR = "coffee_sales_backfill"
+TABLE_NAME = "transactions_static_backfill"
+REJECTS_TABLE_NAME = "transactions_static_backfill_rejects"
+
+# CSV header -> column, with the type it is cast to. values that are empty, ERROR or UNKNOWN,
+# or that do not parse as their type, reject the row
+COLUMNS = {
+    "Transaction ID": ("transaction_id", pa.string()),
+    "Item": ("item_name", pa.string()),
+    "Quantity": ("quantity", pa.int64()),
+    "Price Per Unit": ("unit_price", pa.float64()),
+    "Total Spent": ("total_spent", pa.float64()),
+    "Location": ("location", pa.string()),
+    "Payment Method": ("payment_method", pa.string()),
+    "Transaction Date": ("transaction_date", pa.date32()),
+}
+PLACEHOLDERS = pa.array(["", "ERROR", "UNKNOWN"])
+NUMBER_PATTERNS = {
+    pa.int64(): r"^[0-9]+(\.0*)?$",
+    pa.float64(): r"^[+-]?([0-9]+\.?[0-9]*|\.[0-9]+)$",
+}
+
+
+def clean_batch(batch: pa.RecordBatch) -> Tuple[pa.Table, pa.Table]:
+    """Split one CSV batch into typed rows and rejected rows, without a Python loop over rows.
+
+    Every column is validated and cast with pyarrow compute kernels. A rejected row keeps
+    the raw strings and the name of the first column that failed in `reject_reason`.
+    """
+    raw = {column: pc.utf8_trim_whitespace(batch.column(header)) for header, (column, _) in COLUMNS.items()}
+    typed: Dict[str, pa.Array] = {}
+    invalid: Dict[str, pa.Array] = {}
+    for column, data_type in COLUMNS.values():
+        values = raw[column]
+        missing = pc.or_kleene(pc.is_null(values), pc.is_in(values, value_set=PLACEHOLDERS))
+        if data_type == pa.date32():
+            parsed = pc.cast(pc.strptime(values, format="%Y-%m-%d", unit="s", error_is_null=True), pa.date32())
+            bad = pc.is_null(parsed)
+        elif data_type in NUMBER_PATTERNS:
+            bad = pc.invert(pc.fill_null(pc.match_substring_regex(values, NUMBER_PATTERNS[data_type]), False))
+            # invalid values are nulled first, the cast only sees numbers
+            numbers = pc.cast(pc.if_else(bad, pa.scalar(None, pa.string()), values), pa.float64())
+            parsed = pc.cast(numbers, data_type) if data_type == pa.int64() else numbers
+        else:
+            parsed, bad = values, missing
+        typed[column] = parsed
+        invalid[column] = pc.fill_null(pc.or_kleene(missing, bad), True)
+
+    # first failing column, checked from the last one so the earliest wins
+    reason = pa.nulls(batch.num_rows, pa.string())
+    for column in reversed(list(invalid)):
+        reason = pc.if_else(invalid[column], column, reason)
+    rejected = pc.is_valid(reason)
+
+    clean = pa.table(typed).filter(pc.invert(rejected))
+    rejects = pa.table({**raw, "reject_reason": reason}).filter(rejected)
+    return clean, rejects
+
+
+def read_csv_batches(csv_url: str, block_size: int) -> Iterator[pa.RecordBatch]:
+    """stream the CSV in blocks of `block_size` bytes, every column read as a string"""
+    with fsspec.open(csv_url, "rb") as f:
+        reader = pv.open_csv(
+            f,
+            read_options=pv.ReadOptions(block_size=block_size),
+            convert_options=pv.ConvertOptions(
+                column_types={header: pa.string() for header in COLUMNS},
+                include_columns=list(COLUMNS),
+                strings_can_be_null=False
+            )
+        )
+        for batch in reader:
+            yield batch
+
+
+def write_lake_files(table: pa.Table, fs_client, base_dir: str, basename: str, by_month: bool = True) -> None:
+    """write a batch to the lake as parquet, hive partitioned on the month of transaction_date"""
+    if table.num_rows == 0:
+        return
+    partitioning = None
+    if by_month:
+        month = pc.strftime(pc.cast(table["transaction_date"], pa.timestamp("s")), format="%Y-%m")
+        table = table.append_column("transaction_month", month)
+        partitioning = ds.partitioning(pa.schema([("transaction_month", pa.string())]), flavor="hive")
+    ds.write_dataset(
+        table,
+        base_dir=base_dir,
+        filesystem=PyFileSystem(FSSpecHandler(fs_client)),
+        format="parquet",
+        partitioning=partitioning,
+        basename_template=f"{basename}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+    )
+
+
+def backfill_transactions_static(csv_url: str = DEFAULT_CSV, block_size: int = 64 << 20, write_lake: bool = True, **context) -> Dict[str, int]:
+    """Load the historical sales CSV into the warehouse, and the lake, in one pass.
+
+    The CSV is streamed in blocks, each block is cleaned and typed with Arrow kernels
+    (see clean_batch) and handed to dlt as an Arrow table, which goes to the warehouse
+    without a row by row normalize. Clean rows are merged on transaction_id into
+    `transactions_static_backfill`, the rejects appended to `..._rejects`. The same
+    blocks are written to the lake under coffee_sales_backfill/, partitioned by month.
+    Replaces `dbt seed` for the history, stg_transactions_static reads the typed table.
+    Returns the clean and rejected row counts.
+    """
+    counts = {"clean": 0, "rejected": 0}
+    run_id = context.get("run_id") or pendulum.now().format("YYYYMMDDTHHmmss")
+    basename = "".join(char if char.isalnum() else "_" for char in run_id)
+
+    fs_client, lake_dir = None, None
+    if write_lake:
+        bucket_url = lake_bucket_url()
+        fs_client = fsspec_from_resource(filesystem(bucket_url=bucket_url))
+        lake_dir = fs_client._strip_protocol(f"{bucket_url.rstrip('/')}/{BACKFILL_DIR}")
+
+    clean_hints = dlt.mark.make_hints(
+        table_name=TABLE_NAME,
+        write_disposition="merge",
+        primary_key="transaction_id",
+        # day partitions on BigQuery, ignored by DuckDB
+        columns=[{"name": "transaction_date", "data_type": "date", "partition": True}]
+    )
+    rejects_hints = dlt.mark.make_hints(table_name=REJECTS_TABLE_NAME, write_disposition="append")
+
+    @dlt.resource(name=TABLE_NAME)
+    def sales_history():
+        for index, batch in enumerate(read_csv_batches(csv_url, block_size)):
+            clean, rejects = clean_batch(batch)
+            counts["clean"] += clean.num_rows
+            counts["rejected"] += rejects.num_rows
+            if write_lake:
+                write_lake_files(clean, fs_client, f"{lake_dir}/transactions_static", f"{basename}-{index:05d}")
+                # rejects keep the raw strings, there is no date to partition them by
+                write_lake_files(rejects, fs_client, f"{lake_dir}/transactions_static_rejects", f"{basename}-{index:05d}", by_month=False)
+            if clean.num_rows:
+                yield dlt.mark.with_hints(clean, clean_hints, create_table_variant=True)
+            if rejects.num_rows:
+                yield dlt.mark.with_hints(rejects, rejects_hints, create_table_variant=True)
+
+    pipeline = dlt.pipeline(
+        pipeline_name="backfill_transactions_static",
+        destination=warehouse_destination(),
+        dataset_name="coffee_shop_analysis",
+    )
+    load_info = pipeline.run(sales_history())
+    print(load_info)
+    print(f"backfilled {counts['clean']} rows, rejected {counts['rejected']}")
+    return counts
+
+
+if __name__ == "__main__":
+    # python cafe_backfill_static.py [csv] [--block-size BYTES] [--no-lake]
+    parser = argparse.ArgumentParser(description="typed backfill of the historical sales CSV into the warehouse and the lake")
+    parser.add_argument("csv", nargs="?", default=DEFAULT_CSV, help="local path or fsspec URL (gs://...) of the CSV")
+    parser.add_argument("--block-size", type=int, default=64 << 20, help="bytes of CSV cleaned per batch")
+    parser.add_argument("--no-lake", action="store_true", help="load the warehouse only")
+    args = parser.parse_args()
+    backfill_transactions_static(args.csv, block_size=args.block_size, write_lake=not args.no_lake)
@@ -1,53 +1,129 @@
 # flake8: noqa
-import os
-from typing import Iterator
+import sys
+from datetime import timedelta
+from typing import Dict, Iterator, List, Optional
 
 import dlt
+from dlt.common import pendulum
+from dlt.common.storages.fsspec_filesystem import FileItemDict, glob_files
 from dlt.sources import TDataItems
-from dlt.sources.filesystem import readers
+from dlt.sources.filesystem import filesystem, read_parquet
+from dlt.sources.filesystem.helpers import fsspec_from_resource
+from fsspec import AbstractFileSystem
 
+from cafe_backend import lake_bucket_url, warehouse_destination
+from cafe_metrics import push_metrics, table_metrics
+from cafe_tables import CAFE_TABLES
 
-def read_parquet_chunked(**context) -> None:
+# the extract step writes coffee_sales/<table>/date=YYYY-MM-DD/*.parquet, see `layout` in .dlt/config.toml
+DATASET_DIR = "coffee_sales"
+PARTITION_KEY = "date"
+
+
+# files and bytes read or skipped per table during the current run, printed after the load
+LAKE_STATS: Dict[str, Dict[str, int]] = {}
+
+
+@dlt.resource(standalone=True)
+def lake_files(table_name: str, fs_client: AbstractFileSystem, bucket_url: str) -> Iterator[List[FileItemDict]]:
+    """List the parquet files of a table that were not loaded yet.
+
+    Loaded files are kept in a manifest in the resource state, keyed by path with their size
+    and modification time, so a file is opened again only if it is new or was rewritten.
+    Partitions are named after the load date, so partitions older than the day before the
+    newest loaded file are not even listed, and their entries are dropped from the manifest.
+    """
+    state = dlt.current.resource_state()
+    manifest: Dict[str, List] = state.setdefault("manifest", {})
+    stats = LAKE_STATS.setdefault(table_name, {"files_read": 0, "bytes_read": 0, "files_skipped": 0, "bytes_skipped": 0})
+
+    table_dir = f"{bucket_url.rstrip('/')}/{DATASET_DIR}/{table_name}"
+    if not fs_client.exists(table_dir):
+        return
+
+    since: Optional[str] = None
+    if state.get("watermark"):
+        watermark = pendulum.parse(state["watermark"])
+        since = f"{PARTITION_KEY}={(watermark - timedelta(days=1)).date()}"
+        for path in [path for path in manifest if path.split("/")[2] < since]:
+            del manifest[path]
+
+    partitions = sorted(
+        name for name in (path.rstrip("/").rsplit("/", 1)[-1] for path in fs_client.ls(table_dir, detail=False))
+        if name.startswith(f"{PARTITION_KEY}=") and (since is None or name >= since)
+    )
+    for partition in partitions:
+        files = []
+        for file_item in glob_files(fs_client, bucket_url, f"{DATASET_DIR}/{table_name}/{partition}/*.parquet"):
+            modified = file_item["modification_date"].isoformat()
+            if manifest.get(file_item["relative_path"]) == [file_item["size_in_bytes"], modified]:
+                stats["files_skipped"] += 1
+                stats["bytes_skipped"] += file_item["size_in_bytes"]
+                continue
+            manifest[file_item["relative_path"]] = [file_item["size_in_bytes"], modified]
+            state["watermark"] = max(state.get("watermark") or modified, modified)
+            stats["files_read"] += 1
+            stats["bytes_read"] += file_item["size_in_bytes"]
+            files.append(FileItemDict(file_item, fs_client))
+        if files:
+            yield files
+
+
+def read_parquet_chunked(table_name: str, **context) -> Dict[str, int]:
+    """Load the new parquet files of one table from the lake into the warehouse.
+
+    Every table has its own pipeline, so the DAG loads the tables in parallel as soon as
+    each one was extracted, and a failed table is retried on its own. Returns the rows
+    loaded per table, the DAG only runs the dbt models downstream of tables that got data.
+    The rows, bytes and step times of the run, with the lake files read and skipped, are
+    pushed as pipeline metrics, see cafe_metrics.py.
+    """
     write_disposition = context.get('params', {}).get('write_disposition', 'append')
     print(write_disposition)
+    table = CAFE_TABLES[table_name]
     pipeline = dlt.pipeline(
-        pipeline_name="standard_filesystem",
-        destination='bigquery',
+        pipeline_name=f"standard_filesystem_{table_name}",
+        destination=warehouse_destination(),
         dataset_name="coffee_shop_analysis",
     )
-    # When using the readers resource, you can specify a filter to select only the files you
-    # want to load including a glob pattern. If you use a recursive glob pattern, the filenames
-    # will include the path to the file inside the bucket_url.
-
-    # PARQUET reading
-    parquet_reader1 = readers(file_glob="coffee_sales/items/*.parquet").read_parquet()
-    parquet_reader1.apply_hints(incremental=dlt.sources.incremental("updated_at", primary_key="item_id"))
-    parquet_reader2 = readers(file_glob="coffee_sales/transactions/*.parquet").read_parquet()
-    parquet_reader2.apply_hints(incremental=dlt.sources.incremental("updated_at", primary_key="transaction_id"))
-    parquet_reader3 = readers(file_glob="coffee_sales/transaction_items/*.parquet").read_parquet()
-    parquet_reader3.apply_hints(incremental=dlt.sources.incremental("created_at"), primary_key=("transaction_id", "item_id"))
-    parquet_reader4 = readers(file_glob="coffee_sales/customers/*.parquet").read_parquet()
-    parquet_reader4.apply_hints(incremental=dlt.sources.incremental("updated_at"), primary_key="customer_id")
-    parquet_reader5 = readers(file_glob="coffee_sales/payment_methods/*.parquet").read_parquet()
-    parquet_reader5.apply_hints(incremental=dlt.sources.incremental("created_at"), primary_key="payment_method_id")
-    parquet_reader6 = readers(file_glob="coffee_sales/transactions_static/*.parquet").read_parquet()
-    parquet_reader6.apply_hints(incremental=dlt.sources.incremental("transaction_date"), primary_key="transaction_id")
-    # load both folders together to specified tables
-    load_info = pipeline.run(
-        [
-            #jsonl_reader.with_name("items")
-            parquet_reader1.with_name("items"),
-            parquet_reader2.with_name("transactions"),
-            parquet_reader3.with_name("transaction_items"),
-            parquet_reader4.with_name("customers"),
-            parquet_reader5.with_name("payment_methods"),
-            parquet_reader6.with_name("transactions_static")
-        ],
-        write_disposition=write_disposition
+
+    # bucket and credentials come from `sources.filesystem` in the dlt config, or the local lake
+    bucket_url = lake_bucket_url()
+    fs_client = fsspec_from_resource(filesystem(bucket_url=bucket_url))
+
+    # PARQUET reading with the same cursor the extract step uses.
+    # parallelize() reads the parquet files in a thread pool, see `[extract] workers`
+    parquet_reader = (lake_files(table_name, fs_client, bucket_url).with_name(f"{table_name}_files") | read_parquet()).parallelize()
+    parquet_reader.apply_hints(
+        incremental=dlt.sources.incremental(table["cursor"]),
+        primary_key=table["primary_key"]
     )
+
+    # load the new files to the table of the same name
+    LAKE_STATS.clear()
+    load_info = pipeline.run(parquet_reader.with_name(table_name), write_disposition=write_disposition)
     print(load_info)
-    print(pipeline.last_trace.last_normalize_info)
+    normalize_info = pipeline.last_trace.last_normalize_info
+    print(normalize_info)
+
+    print(f"{'table':<22}{'files read':>12}{'MB read':>10}{'files skipped':>15}{'MB skipped':>12}")
+    for name, stats in LAKE_STATS.items():
+        print(
+            f"{name:<22}{stats['files_read']:>12}{stats['bytes_read'] / 1e6:>10.1f}"
+            f"{stats['files_skipped']:>15}{stats['bytes_skipped'] / 1e6:>12.1f}"
+        )
+
+    lake_stats = LAKE_STATS.get(table_name, {"files_read": 0, "bytes_read": 0, "files_skipped": 0, "bytes_skipped": 0})
+    push_metrics(context, "table_metrics", [table_metrics("gcs_to_bq", table_name, pipeline, **lake_stats)])
+
+    # nothing is normalized when there were no new files
+    row_counts = normalize_info.row_counts if normalize_info else {}
+    loaded_rows = {table_name: row_counts.get(table_name, 0)}
+    print(f"loaded rows: {loaded_rows}")
+    return loaded_rows
 
 
 if __name__ == "__main__":
-    read_parquet_chunked()
\ No newline at end of file
+    # python cafe_gcs2bq.py [table ...]
+    for table_name in sys.argv[1:] or list(CAFE_TABLES):
+        read_parquet_chunked(table_name)
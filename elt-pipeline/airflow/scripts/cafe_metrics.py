@@ -0,0 +1,114 @@
+# flake8: noqa
+# Per run metrics of the cafe pipeline: rows, bytes and seconds per table and step, and the
+# runtime of every dbt model. The callables collect them from the dlt trace and the dbt results
+# and push them to XCom, with timestamps as ISO strings that dlt types back on load.
+# `record_pipeline_metrics` at the end of the DAG appends them to the warehouse dataset
+# METRICS_DATASET, where the dashboard charts their trend. Outside Airflow they are printed only.
+from typing import Dict, List, Optional
+
+import dlt
+from dlt.common import pendulum
+
+from cafe_backend import warehouse_destination
+
+METRICS_DATASET = "coffee_shop_pipeline_metrics"
+# XCom key the callables push their metrics under
+METRICS_XCOM_KEY = "pipeline_metrics"
+
+
+def _step_seconds(trace) -> Dict[str, float]:
+    """seconds spent in each step (extract, normalize, load) of the last pipeline run"""
+    return {
+        step.step: round((step.finished_at - step.started_at).total_seconds(), 3)
+        for step in trace.steps
+        if step.step in ("extract", "normalize", "load") and step.finished_at
+    }
+
+
+def _table_writer_metrics(info, table_name: str) -> Dict[str, int]:
+    """items and bytes written for one table by the extract or normalize step"""
+    totals = {"items": 0, "bytes": 0}
+    if info is None:
+        return totals
+    for load_metrics in info.metrics.values():
+        for metrics in load_metrics:
+            table_metrics = metrics["table_metrics"].get(table_name)
+            if table_metrics:
+                totals["items"] += table_metrics.items_count
+                totals["bytes"] += table_metrics.file_size
+    return totals
+
+
+def table_metrics(step: str, table_name: str, pipeline, **extra) -> Dict:
+    """metrics row of one table for a DAG step, from the trace of the pipeline that moved it.
+
+    `extracted_rows` are the rows read from the source, `loaded_rows` the rows normalized and
+    loaded to the destination, `bytes_written` the size of the files the load step wrote or
+    uploaded. Extra columns, like the lake files read by the load step, are passed as kwargs.
+    """
+    trace = pipeline.last_trace
+    seconds = _step_seconds(trace)
+    extracted = _table_writer_metrics(trace.last_extract_info, table_name)
+    normalized = _table_writer_metrics(trace.last_normalize_info, table_name)
+    return {
+        "step": step,
+        "table_name": table_name,
+        "started_at": trace.started_at.isoformat(),
+        "extracted_rows": extracted["items"],
+        "loaded_rows": normalized["items"],
+        "bytes_written": normalized["bytes"],
+        "extract_seconds": seconds.get("extract", 0.0),
+        "normalize_seconds": seconds.get("normalize", 0.0),
+        "load_seconds": seconds.get("load", 0.0),
+        **extra,
+    }
+
+
+def dbt_model_metrics(run_name: Optional[str], models) -> List[Dict]:
+    """metrics rows of the models of one dbt run, `time` is the model runtime in seconds"""
+    finished_at = pendulum.now().isoformat()
+    return [
+        {
+            "run_name": run_name or "all",
+            "model_name": m.model_name,
+            "status": str(m.status),
+            "seconds": round(m.time, 3),
+            "finished_at": finished_at,
+        }
+        for m in models
+    ]
+
+
+def push_metrics(context: Dict, kind: str, rows: List[Dict]) -> None:
+    """print the metrics and hand them to `record_pipeline_metrics` through XCom"""
+    for row in rows:
+        print(f"{kind}: {row}")
+    ti = context.get("ti")
+    if ti is not None:
+        ti.xcom_push(key=METRICS_XCOM_KEY, value={"kind": kind, "rows": rows})
+
+
+def record_pipeline_metrics(run_id: str, pushed: List[Dict]) -> Dict[str, int]:
+    """Append the metrics pushed by the tasks of a DAG run to the warehouse.
+
+    Every row gets the Airflow `run_id`, so the tables `table_metrics` and `dbt_model_metrics`
+    in METRICS_DATASET hold one row per table and step, and per dbt model, for every run.
+    Returns the rows recorded per table.
+    """
+    tables: Dict[str, List[Dict]] = {}
+    for metrics in pushed:
+        tables.setdefault(metrics["kind"], []).extend({"run_id": run_id, **row} for row in metrics["rows"])
+    if not tables:
+        print("No metrics pushed in this run")
+        return {}
+
+    pipeline = dlt.pipeline(
+        pipeline_name="cafe_pipeline_metrics",
+        destination=warehouse_destination(),
+        dataset_name=METRICS_DATASET,
+    )
+    load_info = pipeline.run(
+        [dlt.resource(rows, name=kind, write_disposition="append") for kind, rows in tables.items()]
+    )
+    print(load_info)
+    return {kind: len(rows) for kind, rows in tables.items()}
@@ -1,63 +1,54 @@
 # flake8: noqa
-import humanize
-from typing import Any
-import os
+import sys
 
 import dlt
-from dlt.common import pendulum
-from dlt.sources.credentials import ConnectionStringCredentials
 
-from dlt.sources.sql_database import sql_database, sql_table, Table
+from dlt.sources.sql_database import sql_database
 
-from sqlalchemy.sql.sqltypes import TypeEngine
-import sqlalchemy as sa
+from cafe_backend import lake_destination
+from cafe_metrics import push_metrics, table_metrics
+from cafe_tables import CAFE_TABLES
 
 
-def load_select_tables_from_database() -> None:
-    """Use the sql_database source to reflect an entire database schema and load select tables from it.
+def load_select_tables_from_database(table_name: str, **context) -> None:
+    """Extract one cafe table from PostgreSQL to the filesystem destination as parquet.
 
-    This example sources data from the public Rfam MySQL database.
+    The table is read incrementally on its cursor column (see cafe_tables.py), so a run
+    only moves rows created or updated since the previous one. Every table has its own
+    pipeline and so its own cursor state, the DAG exports the tables in parallel and
+    retries them one by one. Pass `full_refresh=True` in the DAG params to drop the
+    state and re-export the table from scratch, e.g. for a backfill. The rows, bytes and
+    step times of the run are pushed as pipeline metrics, see cafe_metrics.py.
     """
+    full_refresh = context.get('params', {}).get('full_refresh', False)
+    table = CAFE_TABLES[table_name]
+
     # Create a pipeline
-    pipeline = dlt.pipeline(pipeline_name="load_coffee_sales_data", destination='filesystem', dataset_name="coffee_sales")
-
-    # Credentials for the sample database.
-    # Note: It is recommended to configure credentials in `.dlt/secrets.toml` under `sources.sql_database.credentials`
-    #credentials = ConnectionStringCredentials(
-    #    "mysql+pymysql://rfamro@mysql-rfam-public.ebi.ac.uk:4497/Rfam"
-    #)
-    
-    # To pass the credentials from `secrets.toml`, comment out the above credentials.
-    # And the credentials will be automatically read from `secrets.toml`.
-
-    # Configure the source to load a few select tables incrementally
-    source_transactions = sql_database().with_resources("transactions")
-    source_items = sql_database().with_resources("items")
-    source_transaction_items = sql_database().with_resources("transaction_items")
-    source_customers = sql_database().with_resources("customers")
-    source_payment_methods = sql_database().with_resources("payment_methods")
-    source_transactions_static = sql_database().with_resources("transactions_static")
-    # Add incremental config to the resources. "updated" is a timestamp column in these tables that gets used as a cursor
-    #source_1.transactions.apply_hints(incremental=dlt.sources.incremental("updated"))
-    #source_1.clan.apply_hints(incremental=dlt.sources.incremental("updated"))
-
-    # Run the pipeline. The merge write disposition merges existing rows in the destination by primary key
-    #info = pipeline.run(source_1, write_disposition="merge")
-    info_transactions = pipeline.run(source_transactions, write_disposition="replace", loader_file_format="parquet")
-    info_items = pipeline.run(source_items, write_disposition="replace", loader_file_format="parquet")
-    info_transaction_items = pipeline.run(source_transaction_items, write_disposition="replace", loader_file_format="parquet")
-    info_customers = pipeline.run(source_customers, write_disposition="replace", loader_file_format="parquet")
-    info_payment_methods = pipeline.run(source_payment_methods, write_disposition="replace", loader_file_format="parquet")
-    info_transactions_static = pipeline.run(source_transactions_static, write_disposition="replace", loader_file_format="parquet")
-    print(info_transactions)
-    print(info_items)
-    print(info_transaction_items)
-    print(info_customers)
-    print(info_payment_methods)
-    print(info_transactions_static)
+    pipeline = dlt.pipeline(pipeline_name=f"load_coffee_sales_data_{table_name}", destination=lake_destination(), dataset_name="coffee_sales")
+
+    # Credentials are read from `.dlt/secrets.toml` under `sources.sql_database.credentials`.
+    # Reflect only the table we move, under a schema of its own so a full refresh of one
+    # table does not touch the others
+    source = sql_database(table_names=[table_name]).clone(with_name=f"sql_database_{table_name}")
+    source.resources[table_name].apply_hints(
+        incremental=dlt.sources.incremental(table["cursor"]),
+        primary_key=table["primary_key"]
+    )
+
+    # Run the pipeline. Incremental runs append the new rows, a full refresh drops the
+    # cursor state and replaces the table
+    info = pipeline.run(
+        source,
+        write_disposition="replace" if full_refresh else "append",
+        loader_file_format="parquet",
+        refresh="drop_sources" if full_refresh else None
+    )
+    print(info)
+    print(pipeline.last_trace.last_normalize_info)
+    push_metrics(context, "table_metrics", [table_metrics("postgres_to_gcs", table_name, pipeline)])
 
 if __name__ == "__main__":
-    # Load selected tables with different settings
-    load_select_tables_from_database()
-
-
+    # python cafe_postgres2gcs.py [--full-refresh] [table ...]
+    table_names = [arg for arg in sys.argv[1:] if arg != "--full-refresh"] or list(CAFE_TABLES)
+    for table_name in table_names:
+        load_select_tables_from_database(table_name, params={"full_refresh": "--full-refresh" in sys.argv})
@@ -0,0 +1,15 @@
+# flake8: noqa
+# Tables moved by the cafe pipeline, with the column used as incremental cursor,
+# the primary key and the dbt staging model built from it. Shared by the extract
+# (postgres -> gcs) and load (gcs -> bigquery) steps so both pick up new rows the
+# same way. transactions_static has no hourly staging model, stg_transactions_static
+# (tag `static`) reads the typed table cafe_backfill_static.py loads, or the seed
+# with the dbt var `static_source: seed`.
+CAFE_TABLES = {
+    "items": {"cursor": "updated_at", "primary_key": "item_id", "staging_model": "stg_items"},
+    "transactions": {"cursor": "updated_at", "primary_key": "transaction_id", "staging_model": "stg_transactions"},
+    "transaction_items": {"cursor": "created_at", "primary_key": ("transaction_id", "item_id"), "staging_model": "stg_transaction_items"},
+    "customers": {"cursor": "updated_at", "primary_key": "customer_id", "staging_model": "stg_customers"},
+    "payment_methods": {"cursor": "created_at", "primary_key": "payment_method_id", "staging_model": "stg_payment_methods"},
+    "transactions_static": {"cursor": "transaction_date", "primary_key": "transaction_id", "staging_model": None},
+}
@@ -1,17 +1,39 @@
+import sys
+from typing import List, Optional
+
 import dlt
 
-def run_dbt_transformations() -> None:
+from cafe_backend import warehouse_destination
+from cafe_metrics import dbt_model_metrics, push_metrics
+
+def run_dbt_transformations(select: Optional[List[str]] = None, run_name: Optional[str] = None, **context) -> None:
+    """Run the dbt models, all but the `static` ones, or only the models matched by `select`.
+
+    An empty `select` means no table received new rows, dbt is not started at all. The DAG
+    runs the staging model of each table as soon as that table was loaded, so several runs
+    can overlap. Pass a `run_name` to keep the artifacts and logs of a run in their own
+    directories, so the runs do not overwrite each other's manifest. The runtime of every
+    model is pushed as pipeline metrics, see cafe_metrics.py.
+    """
+    if select is not None and not select:
+        print("No new rows loaded, skipping dbt")
+        return
 
     pipeline = dlt.pipeline(
         pipeline_name="coffee_shop_data_transformation",
-        destination='bigquery',
+        destination=warehouse_destination(),
         dataset_name="coffee_shop_analysis_dbt",
     )
     venv = dlt.dbt.get_venv(pipeline, venv_path="/home/airflow/.local")
     # add dbt runner
     dbt = dlt.dbt.package(pipeline, package_location="/opt/airflow/dbt/coffee_shop_sales_analysis", venv=venv)
 
-    models = dbt.run(cmd_params=["--exclude", "tag:static"])
+    cmd_params = ["--exclude", "tag:static"]
+    if select:
+        cmd_params += ["--select", *select]
+    if run_name:
+        cmd_params += ["--target-path", f"target/{run_name}", "--log-path", f"logs/{run_name}"]
+    models = dbt.run(cmd_params=cmd_params)
     # On success, print the outcome
     print(f"Running {len(models)} models")
     for m in models:
@@ -21,6 +43,8 @@ def run_dbt_transformations() -> None:
             f" with status {m.status}" +
             f" and message {m.message}"
         )
+    push_metrics(context, "dbt_model_metrics", dbt_model_metrics(run_name, models))
 
 if __name__ == "__main__":
-    run_dbt_transformations()
\ No newline at end of file
+    # python cafe_transformation_dbt.py [selector ...]
+    run_dbt_transformations(sys.argv[1:] or None)
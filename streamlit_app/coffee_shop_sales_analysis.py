@@ -1,5 +1,9 @@
 # streamlit app for coffee shop sales analysis
 
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
 import streamlit as st
 import pandas as pd
 import plotly.express as px
@@ -7,6 +11,43 @@ from google.cloud import bigquery
 from google.oauth2 import service_account
 import json
 from pygwalker.api.streamlit import StreamlitRenderer
+from result_cache import ResultCache
+
+# `bigquery` reads the dbt marts in BigQuery, `duckdb` reads them from the local
+# DuckDB file the pipeline builds with CAFE_BACKEND=duckdb
+CAFE_BACKEND = os.getenv("CAFE_BACKEND", "bigquery")
+DUCKDB_PATH = os.getenv("DUCKDB_PATH", "/data/coffee_shop.duckdb")
+
+# query results on disk, reused until the marts change
+QUERY_CACHE_DIR = os.getenv("QUERY_CACHE_DIR", ".query_cache")
+# seconds between checks of the data watermark
+WATERMARK_CHECK_SECONDS = int(os.getenv("WATERMARK_CHECK_SECONDS", 60))
+# the tables the dashboard reads, their last change is the data watermark
+DASHBOARD_TABLES = ["agg_daily_item_quantity", "agg_daily_sales", "fct_transactions"]
+
+# dry-run guard, BigQuery queries that would scan more bytes are refused (0 turns it off)
+MAX_QUERY_BYTES = int(os.getenv("MAX_QUERY_BYTES", 0))
+
+# days of pipeline metrics charted in the pipeline runtime section
+PIPELINE_METRICS_DAYS = int(os.getenv("PIPELINE_METRICS_DAYS", 30))
+
+# hard limits for the data explorer, rows and bytes loaded into the page
+EXPLORER_MAX_ROWS = int(os.getenv("EXPLORER_MAX_ROWS", 200000))
+EXPLORER_MAX_BYTES = int(os.getenv("EXPLORER_MAX_BYTES", 200 * 1024 * 1024))
+# explorer results kept in memory, every entry can hold up to EXPLORER_MAX_BYTES
+EXPLORER_CACHE_ENTRIES = int(os.getenv("EXPLORER_CACHE_ENTRIES", 4))
+EXPLORER_CACHE_TTL_SECONDS = int(os.getenv("EXPLORER_CACHE_TTL_SECONDS", 3600))
+# columns of fct_transactions offered in the explorer
+EXPLORER_COLUMNS = [
+    "transaction_id",
+    "transaction_date",
+    "payment_method_name",
+    "location",
+    "total_spent",
+    "customer_id",
+    "created_at",
+    "updated_at",
+]
 
 # Set page config
 st.set_page_config(
@@ -15,44 +56,126 @@ st.set_page_config(
     layout="wide"
 )
 
-# upload credentials file
-uploaded_file = st.file_uploader("Upload credentials file", type=["json"])
-if uploaded_file is not None:
-    credentials_json = json.loads(uploaded_file.read())
-    credentials = service_account.Credentials.from_service_account_info(credentials_json)
-    client = bigquery.Client(credentials=credentials)
-    st.success("Credentials file uploaded successfully")
+if CAFE_BACKEND == "duckdb":
+    import duckdb
+
+    # Function to run DuckDB query, read only so the pipeline can keep writing between queries.
+    # returns (dataframe, bytes processed), DuckDB does not report the bytes it scanned
+    def run_query(query):
+        with duckdb.connect(DUCKDB_PATH, read_only=True) as con:
+            return con.sql(query).df(), None
+
+    # Arrow result for the explorer, params are bound as $name
+    def run_arrow_query(query, params):
+        with duckdb.connect(DUCKDB_PATH, read_only=True) as con:
+            result = con.execute(query, params).arrow()
+            # newer duckdb returns a RecordBatchReader from arrow()
+            return (result.read_all() if hasattr(result, "read_all") else result), None
+
+    def table(name):
+        return f"coffee_shop_analysis_dbt.{name}"
+
+    def metrics_table(name):
+        return f"coffee_shop_pipeline_metrics.{name}"
+
+    def month_of(column):
+        return f"DATE_TRUNC('month', {column})"
+
+    def param(name):
+        return f"${name}"
+
+    # every pipeline run writes the file, its modification time is the watermark
+    def data_watermark():
+        paths = [DUCKDB_PATH, f"{DUCKDB_PATH}.wal"]
+        return str(max(os.path.getmtime(path) for path in paths if os.path.exists(path)))
+
+    def sample_clause(percent):
+        return f"TABLESAMPLE BERNOULLI ({percent} PERCENT)"
 else:
-    st.warning("Please upload a credentials file")
-    st.stop()
+    # upload credentials file
+    uploaded_file = st.file_uploader("Upload credentials file", type=["json"])
+    if uploaded_file is not None:
+        credentials_json = json.loads(uploaded_file.read())
+        credentials = service_account.Credentials.from_service_account_info(credentials_json)
+        client = bigquery.Client(credentials=credentials)
+        st.success("Credentials file uploaded successfully")
+    else:
+        st.warning("Please upload a credentials file")
+        st.stop()
+
+    def check_query_size(query, job_config=None):
+        """dry run the query and refuse it if it would scan more than MAX_QUERY_BYTES"""
+        if not MAX_QUERY_BYTES:
+            return
+        dry_run_config = bigquery.QueryJobConfig(
+            dry_run=True,
+            use_query_cache=False,
+            query_parameters=job_config.query_parameters if job_config else []
+        )
+        scanned = client.query(query, job_config=dry_run_config).total_bytes_processed
+        if scanned > MAX_QUERY_BYTES:
+            raise ValueError(f"query would scan {scanned / 1e6:.1f} MB, above the MAX_QUERY_BYTES limit of {MAX_QUERY_BYTES / 1e6:.1f} MB")
+
+    # Function to run BigQuery query, returns (dataframe, bytes processed)
+    def run_query(query):
+        check_query_size(query)
+        query_job = client.query(query)
+        return query_job.to_dataframe(), query_job.total_bytes_processed
 
-# Function to run BigQuery query
-def run_query(query):
-    query_job = client.query(query)
-    return query_job.to_dataframe()
+    # Arrow result for the explorer through the BigQuery Storage read API, params are
+    # DATE values bound as @name. maximum_bytes_billed makes BigQuery refuse larger scans
+    def run_arrow_query(query, params):
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[bigquery.ScalarQueryParameter(name, "DATE", value) for name, value in params.items()],
+            maximum_bytes_billed=EXPLORER_MAX_BYTES
+        )
+        check_query_size(query, job_config)
+        query_job = client.query(query, job_config=job_config)
+        return query_job.to_arrow(create_bqstorage_client=True), query_job.total_bytes_processed
+
+    def table(name):
+        return f"`cloud-385312.coffee_shop_analysis_dbt.{name}`"
+
+    def metrics_table(name):
+        return f"`cloud-385312.coffee_shop_pipeline_metrics.{name}`"
+
+    def month_of(column):
+        return f"DATE_TRUNC({column}, month)"
+
+    def param(name):
+        return f"@{name}"
+
+    # last modification of the dashboard tables, a metadata call that scans nothing
+    def data_watermark():
+        return max(
+            client.get_table(f"cloud-385312.coffee_shop_analysis_dbt.{name}").modified
+            for name in DASHBOARD_TABLES
+        ).isoformat()
+
+    def sample_clause(percent):
+        return f"TABLESAMPLE SYSTEM ({percent} PERCENT)"
 
 # Title
 st.title("☕ Coffee Shop Sales Analysis")
 
-# Query item count pie chart    
-item_count_query = """
+# Query item count pie chart, from the daily item quantity mart
+item_count_query = f"""
 SELECT 
-    i.name as item_name,
-    SUM(tx_i.quantity) as total_quantity
-FROM `cloud-385312.coffee_shop_analysis_dbt.dim_transaction_items` tx_i
-LEFT JOIN `cloud-385312.coffee_shop_analysis_dbt.dim_items` i ON tx_i.item_id = i.item_id
+    item_name,
+    SUM(total_quantity) as total_quantity
+FROM {table('agg_daily_item_quantity')}
 GROUP BY item_name
 """
 
-# Query for monthly sales
-monthly_sales_query = """
+# Query for monthly sales, from the daily sales mart (a transaction belongs to one day)
+monthly_sales_query = f"""
 WITH monthly_sales AS (
     SELECT 
-        DATE_TRUNC(transaction_date, month) AS month,
-        COUNT(DISTINCT transaction_id) as order_count,
-        SUM(CAST(total_spent AS NUMERIC)) as total_sales,
-    FROM `cloud-385312.coffee_shop_analysis_dbt.fct_transactions`
-    GROUP BY DATE_TRUNC(transaction_date, month)
+        {month_of('transaction_date')} AS month,
+        SUM(order_count) as order_count,
+        SUM(total_sales) as total_sales,
+    FROM {table('agg_daily_sales')}
+    GROUP BY {month_of('transaction_date')}
 )
 SELECT
     month,
@@ -62,43 +185,137 @@ FROM monthly_sales
 ORDER BY month ASC;
 """
 
-# pygwalker query
-pygwalker_query = """
-SELECT * FROM `cloud-385312.coffee_shop_analysis_dbt.fct_transactions`
+# date range of the data, bounds for the explorer date picker
+date_range_query = f"""
+SELECT
+    MIN(transaction_date) as first_date,
+    MAX(transaction_date) as last_date
+FROM {table('agg_daily_sales')}
 """
 
-# Run queries and cache results
-@st.cache_data(ttl=3600)
-def run_queries():
-    item_count_df = run_query(item_count_query)
-    monthly_sales_df = run_query(monthly_sales_query)
-    pygwalker_df = run_query(pygwalker_query)
-    return item_count_df, monthly_sales_df, pygwalker_df
+@st.cache_resource
+def result_cache():
+    return ResultCache(QUERY_CACHE_DIR)
 
-item_count_df, monthly_sales_df, pygwalker_df = run_queries()
 
-# Create three columns for the charts
-col1, = st.columns(1)
+@st.cache_data(ttl=WATERMARK_CHECK_SECONDS)
+def current_watermark():
+    return data_watermark()
 
-# First chart: Item Quantity Pie Chart
-with col1:
+
+def run_cached(name, key, watermark, cache, run):
+    """result of run() through the disk cache, with timing, bytes processed and cache hit.
+    called from worker threads, so it must not use any st.* function"""
+    stats = {"query": name, "cache_hit": True, "bytes_processed": None, "error": None}
+    started = time.perf_counter()
+
+    def run_and_measure():
+        stats["cache_hit"] = False
+        df, stats["bytes_processed"] = run()
+        return df
+
+    try:
+        df, _ = cache.get_or_run(key, watermark, run_and_measure)
+    except Exception as e:
+        df, stats["error"] = None, str(e)
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    return df, stats
+
+
+# pygwalker data, only the chosen columns and days (transaction_date is the partition column).
+# the stats of a query that ran go to _run_stats, a call answered from memory leaves it empty.
+# failures raise, so st.cache_data does not keep them
+@st.cache_data(max_entries=EXPLORER_CACHE_ENTRIES, ttl=EXPLORER_CACHE_TTL_SECONDS)
+def load_explorer_data(columns, start, end, sample_percent, watermark, _run_stats):
+    sample = sample_clause(sample_percent) if sample_percent < 100 else ""
+    query = f"""
+    SELECT {", ".join(columns)}
+    FROM {table('fct_transactions')} {sample}
+    WHERE transaction_date BETWEEN {param('start')} AND {param('end')}
+    LIMIT {EXPLORER_MAX_ROWS + 1}
+    """
+    params = {"start": start, "end": end}
+
+    def run():
+        arrow_table, bytes_processed = run_arrow_query(query, params)
+        return arrow_table.to_pandas(), bytes_processed
+
+    df, stats = run_cached("explorer", f"{query} {params}", watermark, result_cache(), run)
+    _run_stats.update(stats)
+    if df is None:
+        raise RuntimeError(stats["error"])
+
+    truncated = len(df) > EXPLORER_MAX_ROWS
+    df = df.iloc[:EXPLORER_MAX_ROWS]
+    size = int(df.memory_usage(deep=True).sum())
+    if size > EXPLORER_MAX_BYTES:
+        truncated = True
+        df = df.iloc[:len(df) * EXPLORER_MAX_BYTES // size]
+    return df, truncated
+
+
+def load_explorer_data_measured(*args):
+    """load_explorer_data with the stats of this call, measured around the cache"""
+    run_stats = {}
+    stats = {"query": "explorer", "cache_hit": True, "bytes_processed": None, "error": None}
+    started = time.perf_counter()
+    try:
+        df, truncated = load_explorer_data(*args, run_stats)
+    except Exception as e:
+        df, truncated, stats["error"] = None, False, str(e)
+    # only a query that ran reports its disk cache hit and bytes processed
+    stats.update({key: run_stats[key] for key in ("cache_hit", "bytes_processed") if key in run_stats})
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    return df, truncated, stats
+
+
+# per run metrics the cafe_data_pipeline DAG appends to the warehouse, they change every run
+# so they bypass the disk cache
+@st.cache_data(ttl=WATERMARK_CHECK_SECONDS)
+def load_pipeline_metrics(days):
+    table_metrics_df, _ = run_query(f"""
+    SELECT
+        run_id,
+        MIN(started_at) AS started_at,
+        step,
+        table_name,
+        SUM(loaded_rows) AS loaded_rows,
+        SUM(bytes_written) AS bytes_written,
+        SUM(extract_seconds + normalize_seconds + load_seconds) AS seconds
+    FROM {metrics_table('table_metrics')}
+    WHERE started_at >= CURRENT_TIMESTAMP - INTERVAL {days} DAY
+    GROUP BY run_id, step, table_name
+    ORDER BY started_at
+    """)
+    dbt_model_metrics_df, _ = run_query(f"""
+    SELECT
+        run_id,
+        MIN(finished_at) AS finished_at,
+        model_name,
+        SUM(seconds) AS seconds
+    FROM {metrics_table('dbt_model_metrics')}
+    WHERE finished_at >= CURRENT_TIMESTAMP - INTERVAL {days} DAY
+    GROUP BY run_id, model_name
+    ORDER BY finished_at
+    """)
+    return table_metrics_df, dbt_model_metrics_df
+
+
+def render_item_count(df):
     st.subheader("Item Quantity Pie Chart")
     fig1 = px.pie(
-        item_count_df,
+        df,
         values='total_quantity',
         names='item_name',
         title='Item Quantity'
     )
     st.plotly_chart(fig1, use_container_width=True)
 
-st.markdown("---")
 
-col2, = st.columns(1)
-# Third chart: Daily Sales by Location
-with col2:
+def render_monthly_sales(df):
     st.subheader("Monthly Sales")
     fig3 = px.line(
-        monthly_sales_df,
+        df,
         x='month',
         y='total_sales',
         title='Monthly Sales',
@@ -106,12 +323,125 @@ with col2:
     )
     st.plotly_chart(fig3, use_container_width=True)
 
+
+watermark = current_watermark()
+diagnostics = []
+
+# Create three columns for the charts, each tile is filled as soon as its query returns
+col1, = st.columns(1)
+with col1:
+    item_count_tile = st.empty()
+    item_count_tile.info("Loading item quantities...")
+
+st.markdown("---")
+
+col2, = st.columns(1)
+with col2:
+    monthly_sales_tile = st.empty()
+    monthly_sales_tile.info("Loading monthly sales...")
+
 st.markdown("---")
 
+# the date range query feeds the explorer form, it has no tile of its own
+tiles = {
+    "item_count": (item_count_query, item_count_tile, render_item_count),
+    "monthly_sales": (monthly_sales_query, monthly_sales_tile, render_monthly_sales),
+    "date_range": (date_range_query, None, None),
+}
+results = {}
+cache = result_cache()
+with ThreadPoolExecutor(max_workers=len(tiles)) as pool:
+    futures = {
+        pool.submit(run_cached, name, query, watermark, cache, lambda query=query: run_query(query)): name
+        for name, (query, _, _) in tiles.items()
+    }
+    for future in as_completed(futures):
+        name = futures[future]
+        df, stats = future.result()
+        results[name] = df
+        diagnostics.append(stats)
+        _, tile, render = tiles[name]
+        if tile is None:
+            continue
+        with tile.container():
+            if df is None:
+                st.error(f"Could not load this tile: {stats['error']}")
+            else:
+                render(df)
+
 col3, = st.columns(1)
 with col3:
     st.subheader("PygWalker")
-    # change date column to pandas datetime
-    pygwalker_df['transaction_date'] = pd.to_datetime(pygwalker_df['transaction_date'])
-    pyg_app = StreamlitRenderer(pygwalker_df)
-    pyg_app.explorer()
+    date_range_df = results["date_range"]
+    if date_range_df is None or pd.isna(date_range_df.iloc[0]["first_date"]):
+        st.info("No transactions loaded yet")
+    else:
+        first_date, last_date = date_range_df.iloc[0]["first_date"], date_range_df.iloc[0]["last_date"]
+        first_date, last_date = pd.Timestamp(first_date).date(), pd.Timestamp(last_date).date()
+
+        # nothing is fetched until the form is submitted
+        with st.form("explorer"):
+            picked_dates = st.date_input(
+                "Transaction dates",
+                value=(max(first_date, last_date - timedelta(days=90)), last_date),
+                min_value=first_date,
+                max_value=last_date
+            )
+            columns = st.multiselect("Columns", EXPLORER_COLUMNS, default=EXPLORER_COLUMNS[:5])
+            sample_percent = st.slider("Sample (% of rows)", min_value=1, max_value=100, value=100)
+            submitted = st.form_submit_button("Load explorer")
+        if submitted:
+            st.session_state["explorer_args"] = (tuple(columns), *picked_dates, sample_percent)
+
+        explorer_args = st.session_state.get("explorer_args")
+        if explorer_args is None or len(explorer_args) != 4 or not explorer_args[0]:
+            st.info("Pick a date range and at least one column, then load the explorer")
+        else:
+            pygwalker_df, truncated, stats = load_explorer_data_measured(*explorer_args, watermark)
+            diagnostics.append(stats)
+            if pygwalker_df is None:
+                st.error(f"Could not load the explorer: {stats['error']}")
+            else:
+                if truncated:
+                    st.warning(f"Showing {len(pygwalker_df)} rows only, narrow the dates or sample to see the rest")
+                # change date column to pandas datetime
+                if 'transaction_date' in pygwalker_df:
+                    pygwalker_df['transaction_date'] = pd.to_datetime(pygwalker_df['transaction_date'])
+                pyg_app = StreamlitRenderer(pygwalker_df)
+                pyg_app.explorer()
+
+st.markdown("---")
+
+# runtime trend of the pipeline per table and dbt model, only queried when asked for
+with st.expander("Pipeline runtime"):
+    if st.checkbox(f"Load the pipeline metrics of the last {PIPELINE_METRICS_DAYS} days"):
+        try:
+            table_metrics_df, dbt_model_metrics_df = load_pipeline_metrics(PIPELINE_METRICS_DAYS)
+        except Exception as e:
+            st.error(f"Could not load the pipeline metrics: {e}")
+        else:
+            st.plotly_chart(px.line(
+                table_metrics_df,
+                x='started_at',
+                y='seconds',
+                color='table_name',
+                facet_row='step',
+                markers=True,
+                title='Seconds per table and step',
+                hover_data=['loaded_rows', 'bytes_written']
+            ), use_container_width=True)
+            st.plotly_chart(px.line(
+                dbt_model_metrics_df,
+                x='finished_at',
+                y='seconds',
+                color='model_name',
+                markers=True,
+                title='Seconds per dbt model'
+            ), use_container_width=True)
+
+st.markdown("---")
+
+# per query timing, bytes processed and cache hits of this page view
+with st.expander("Diagnostics"):
+    st.caption(f"backend: {CAFE_BACKEND}, data watermark: {watermark}, query byte limit: {MAX_QUERY_BYTES or 'off'}")
+    st.dataframe(pd.DataFrame(diagnostics, columns=["query", "seconds", "bytes_processed", "cache_hit", "error"]))
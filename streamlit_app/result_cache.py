@@ -0,0 +1,69 @@
+# result_cache.py
+# query results kept on disk as parquet, one file per query. an entry is valid as long as
+# the data watermark it was stored with matches the current one, so results survive
+# restarts and redeploys and the warehouse is only queried after the marts changed.
+import hashlib
+import os
+import time
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+class ResultCache:
+    def __init__(self, cache_dir: str, max_age_days: float = 7):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_age_seconds = max_age_days * 24 * 3600
+
+    def path(self, key: str) -> Path:
+        return self.cache_dir / f"{hashlib.sha256(key.encode()).hexdigest()}.parquet"
+
+    def get(self, key: str, watermark: str) -> pd.DataFrame | None:
+        """cached result of key if it was stored at this watermark"""
+        path = self.path(key)
+        try:
+            metadata = pq.read_schema(path).metadata or {}
+            if metadata.get(b"watermark") != watermark.encode():
+                return None
+            df = pq.read_table(path).to_pandas()
+        except (FileNotFoundError, pa.ArrowInvalid):
+            return None
+        # keep entries in use from being evicted
+        os.utime(path)
+        return df
+
+    def put(self, key: str, watermark: str, df: pd.DataFrame) -> None:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata({
+            **(table.schema.metadata or {}),
+            b"watermark": watermark.encode(),
+            b"key": key.encode(),
+        })
+        # write next to the entry and swap it in, readers never see a partial file
+        path = self.path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def get_or_run(self, key: str, watermark: str, run) -> tuple[pd.DataFrame, bool]:
+        """(result, True) from disk, or (run(), False) after storing it"""
+        df = self.get(key, watermark)
+        if df is not None:
+            return df, True
+        df = run()
+        self.put(key, watermark, df)
+        return df, False
+
+    def evict(self) -> None:
+        """drop entries not used for max_age_days, e.g. old explorer filters"""
+        cutoff = time.time() - self.max_age_seconds
+        for path in self.cache_dir.glob("*.parquet"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except FileNotFoundError:
+                pass